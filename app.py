@@ -1,35 +1,383 @@
 import pandas as pd
 import sqlite3
 import json
+import functools
+import io
+import csv
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from queue import Empty
 import streamlit as st
+import streamlit.logger as streamlit_logger
 import plotly.express as px
+import openpyxl
 import os
 import re
+import time
+import logging
+import contextlib
+import contextvars
+import cProfile
+import pstats
+import tracemalloc
+import hashlib
+from collections import Counter, OrderedDict
+from datetime import datetime
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
+from typing import Mapping, NamedTuple
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    # Parquet export is offered only when pyarrow is installed
+    pa = pq = None
 
-def create_dataframe(file, idx, table,config_json_path):
+# Strings pd.read_excel treats as missing values, applied to streamed chunks too
+NA_STRINGS = ['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+              '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null']
+
+NUMERIC_SQL_TYPES = ('INT', 'REAL', 'FLOA', 'DOUB', 'NUMERIC', 'DECIMAL')
+
+# Content hash of each row, stored next to the primary key so unchanged rows are not rewritten
+ROW_HASH_COLUMN = "_row_hash"
+
+class TablePlan(NamedTuple):
+    # Everything derived from the config for one table, built once per config file version
+    table: str
+    column_mapping: Mapping[str, str]  # Excel header -> database column
+    columns: tuple
+    column_types: Mapping[str, str]  # database column -> declared SQL type
+    primary_keys: tuple
+    ddl: str
+    upsert_sql: str
+    indexes: Mapping[str, tuple]  # index name -> indexed columns
+    categorical_filters: tuple
+    numerical_filters: tuple
+    date_filters: tuple
+    histogram_columns: tuple
+    pie_columns: tuple
+    bar_columns: tuple
+    line_columns: tuple
+    scatter_columns: tuple
+    stats_columns: tuple  # filter columns tracked in the statistics catalog
+
+class ConfigPlan(NamedTuple):
+    db_path: str
+    table_names: tuple
+    batch_size: int
+    db_config: Mapping[str, object]
+    tables: Mapping[str, TablePlan]
+
+def split_columns(value):
+    # Column lists in the config are comma separated strings, unused entries may be "" or {}
+    if not value or not isinstance(value, str):
+        return []
+    return [col.strip() for col in value.split(",") if col.strip()]
+
+def column_types(name_dict):
+    # Map database column name to its declared SQL type, e.g. {"units_sold": "INTEGER"}
+    types = {}
+    for key, val in name_dict.items():
+        if key != "PRIMARY KEY":
+            parts = val.split(" ", 1)
+            types[parts[0]] = parts[1].strip().upper() if len(parts) > 1 else ""
+    return types
+
+def build_upsert_sql(table_name, columns, primary_keys, source=None):
+    # With a source table the rows come from a SELECT; "WHERE true" keeps SQLite from reading ON as a join clause
+    update_cols = [col for col in columns if col not in primary_keys]
+    rows = f"SELECT {', '.join(columns)} FROM {source} WHERE true" if source else f"VALUES ({', '.join(['?' for _ in columns])})"
+    return f"""
+            INSERT INTO {table_name} ({', '.join(columns)}) 
+            {rows}
+            ON CONFLICT({', '.join(primary_keys)}) DO {'UPDATE SET ' + ', '.join([f'{col} = excluded.{col}' for col in update_cols]) if update_cols else 'NOTHING'}
+            """
+
+def build_filter_indexes(table_name, columns, primary_keys, cat_cols, range_cols):
+    cat_cols = [col for col in cat_cols if col in columns]
+    range_cols = [col for col in range_cols if col in columns]
+    indexes = {}
+    for col in cat_cols + range_cols:
+        # The primary key index already covers its leading column
+        if col != primary_keys[0]:
+            indexes[f"idx_{table_name}_{col}"] = (col,)
+    if len(cat_cols) > 1:
+        # Equality columns first, then one range column
+        indexes[f"idx_{table_name}_filters"] = tuple(cat_cols + range_cols[:1])
+    return indexes
+
+def build_table_plan(table_name, config):
+    name_dict = config['header_mapping'][table_name]
+    view = config.get('view_mapping', {}).get(table_name, {})
+    graphs = view.get("graphs", {})
+    filters = view.get("filters", {})
+    column_mapping = {key: val.split(" ")[0] for key, val in name_dict.items() if key != "PRIMARY KEY"}
+    columns = tuple(column_mapping.values())
+    primary_keys = tuple(key.strip() for key in name_dict["PRIMARY KEY"].split(","))
+    columns_str = ",\n    ".join(val for key, val in name_dict.items() if key != "PRIMARY KEY")
+    ddl = f"""
+            CREATE TABLE {table_name} (
+                {columns_str},
+                {ROW_HASH_COLUMN} INTEGER,
+                PRIMARY KEY ({name_dict["PRIMARY KEY"]})
+            );
+            """
+    cat_cols = tuple(split_columns(filters.get("categorical")))
+    num_cols = tuple(split_columns(filters.get("numerical")))
+    date_cols = tuple(split_columns(filters.get("date")))
+    return TablePlan(
+        table=table_name,
+        column_mapping=MappingProxyType(column_mapping),
+        columns=columns,
+        column_types=MappingProxyType(column_types(name_dict)),
+        primary_keys=primary_keys,
+        ddl=ddl,
+        upsert_sql=build_upsert_sql(table_name, columns + (ROW_HASH_COLUMN,), primary_keys),
+        indexes=MappingProxyType(build_filter_indexes(table_name, columns, primary_keys, list(cat_cols), list(num_cols + date_cols))),
+        categorical_filters=cat_cols,
+        numerical_filters=num_cols,
+        date_filters=date_cols,
+        histogram_columns=tuple(split_columns(graphs.get("histogram"))),
+        pie_columns=tuple(split_columns(graphs.get("pie"))),
+        bar_columns=tuple(split_columns(graphs.get("bar"))),
+        line_columns=tuple(split_columns(graphs.get("line"))),
+        scatter_columns=tuple(split_columns(graphs.get("scatter"))),
+        stats_columns=tuple(col for col in dict.fromkeys(cat_cols + num_cols + date_cols) if col in columns),
+    )
+
+@functools.lru_cache(maxsize=32)
+def _load_plan(config_json_path, mtime_ns, size):
+    with open(config_json_path) as f:
+        config = json.load(f)
+    creds = config['db_config']
+    return ConfigPlan(
+        db_path=creds.get("db_path"),
+        table_names=tuple(table.strip() for table in creds.get("table_name").split(",")),
+        batch_size=int(creds.get("batch_size") or 1000),
+        db_config=MappingProxyType(dict(creds)),
+        tables=MappingProxyType({table: build_table_plan(table, config) for table in config['header_mapping']}),
+    )
+
+def load_plan(config_json_path):
+    # Memoized on path and modification time, so an edited config is parsed again
+    stat = os.stat(config_json_path)
+    return _load_plan(os.path.abspath(config_json_path), stat.st_mtime_ns, stat.st_size)
+
+def table_plan(config_json_path, table_name):
+    return load_plan(config_json_path).tables[table_name]
+
+def headless_mode():
+    # Silence Streamlit's bare-mode warnings when the pipeline runs outside `streamlit run`.
+    # Streamlit resets its log level when it parses its config, so parse it first.
+    os.environ.setdefault("STREAMLIT_LOGGER_LEVEL", "error")
+    os.environ.setdefault("STREAMLIT_GLOBAL_SHOW_WARNING_ON_DIRECT_EXECUTION", "false")
+    st.get_option("logger.level")
+    streamlit_logger.set_log_level("error")
+
+logger = logging.getLogger("excel_db")
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+_current_run = contextvars.ContextVar("current_run", default=None)
+# The background ingest job running in this context, if any
+_current_job = contextvars.ContextVar("current_job", default=None)
+
+class IngestCancelled(Exception):
+    pass
+
+def notify(message, warning=False):
+    # Background jobs have no Streamlit page to write to, so their messages go to the job instead
+    job = _current_job.get()
+    if job is not None:
+        job.log(message)
+    elif warning:
+        st.warning(message)
+    else:
+        st.write(message)
+
+def check_cancelled():
+    job = _current_job.get()
+    if job is not None and job.cancel_event.is_set():
+        raise IngestCancelled(f"Job {job.id} cancelled")
+
+def report_progress(rows, counts=None):
+    # counts=None announces parsed rows that are about to be written
+    job = _current_job.get()
+    if job is not None:
+        if counts is None:
+            job.rows_parsed += rows
+        else:
+            job.advance(rows, counts)
+
+class RunMetrics:
+    # Duration, rows and bytes per pipeline stage, summed over repeated stages such as batches
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+        self.stages = OrderedDict()
+
+    def add(self, stage_name, seconds, rows=0, nbytes=0):
+        stage = self.stages.setdefault(stage_name, {"stage": stage_name, "calls": 0, "seconds": 0.0, "rows": 0, "bytes": 0})
+        stage["calls"] += 1
+        stage["seconds"] += seconds
+        stage["rows"] += rows or 0
+        stage["bytes"] += nbytes or 0
+
+    def summary(self):
+        return [dict(stage, seconds=round(stage["seconds"], 4)) for stage in self.stages.values()]
+
+    def log(self):
+        for stage in self.summary():
+            logger.info(json.dumps({"run": self.name, **stage}, default=str))
+        logger.info(json.dumps({"run": self.name, "stage": "total", "seconds": round(self.seconds, 4)}))
+
+@contextlib.contextmanager
+def stage(name, rows=0, nbytes=0):
+    # Times a block for the current run; set record["rows"] / record["bytes"] inside when they are only known later
+    record = {"rows": rows, "bytes": nbytes}
+    start = time.perf_counter()
     try:
-        with open(config_json_path) as f:
-            config = json.load(f)
-        name_dict = config['header_mapping'][table]
-        if idx == -1:
-            df = pd.read_excel(file)
+        yield record
+    finally:
+        run = _current_run.get()
+        if run is not None:
+            run.add(name, time.perf_counter() - start, record["rows"], record["bytes"])
+
+def timed_chunks(chunks, name):
+    # Attributes the time spent producing each chunk of a generator to a stage
+    chunks = iter(chunks)
+    while True:
+        with stage(name) as record:
+            chunk = next(chunks, None)
+            if chunk is not None:
+                record["rows"] = len(chunk)
+                record["bytes"] = int(chunk.memory_usage(deep=True).sum())
+        if chunk is None:
+            return
+        yield chunk
+
+@contextlib.contextmanager
+def instrumented_run(name, db_config=None):
+    # db_config["profile"] = "cprofile" or "tracemalloc" profiles the run and writes the report to db_config["profile_dir"]
+    db_config = db_config or {}
+    run = RunMetrics(name)
+    token = _current_run.set(run)
+    mode = db_config.get("profile")
+    profiler = None
+    if mode == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+    elif mode == "tracemalloc" and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    try:
+        yield run
+    finally:
+        run.seconds = time.perf_counter() - run.started
+        _current_run.reset(token)
+        if mode in ("cprofile", "tracemalloc"):
+            profile_dir = db_config.get("profile_dir", "temp")
+            os.makedirs(profile_dir, exist_ok=True)
+            report_path = os.path.join(profile_dir, f"{name}_{time.strftime('%Y%m%d_%H%M%S')}_{mode}.txt")
+            with open(report_path, "w") as report:
+                if profiler is not None:
+                    profiler.disable()
+                    profiler.dump_stats(report_path[:-4] + ".prof")
+                    pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(40)
+                elif tracemalloc.is_tracing():
+                    snapshot = tracemalloc.take_snapshot()
+                    current, peak = tracemalloc.get_traced_memory()
+                    tracemalloc.stop()
+                    report.write(f"current {current / 2**20:.1f} MB, peak {peak / 2**20:.1f} MB\n")
+                    for stat in snapshot.statistics("lineno")[:25]:
+                        report.write(f"{stat}\n")
+                    run.add("tracemalloc_peak", 0, nbytes=peak)
+            logger.info(json.dumps({"run": name, "profile": mode, "report": report_path}))
+        run.log()
+
+def render_metrics(run):
+    with st.expander(f"Performance metrics: {run.name}"):
+        stages = pd.DataFrame(run.summary())
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Total time", f"{run.seconds:.2f}s")
+        if not stages.empty:
+            slowest = stages.loc[stages["seconds"].idxmax()]
+            col2.metric("Slowest stage", slowest["stage"], f"{slowest['seconds']:.2f}s", delta_color="off")
+            col3.metric("Rows in largest stage", f"{int(stages['rows'].max()):,}")
+            stages["rows_per_s"] = (stages["rows"] / stages["seconds"].where(stages["seconds"] > 0)).round()
+            st.dataframe(stages, hide_index=True)
+
+def map_columns(columns, column_mapping, table):
+    new_columns = []
+    for column in columns:
+        if column in column_mapping:
+            new_columns.append(column_mapping[column])
         else:
-            df = pd.read_excel(file, sheet_name=idx)
+            print(f"Warning: Column '{column}' not found in the header mapping for table '{table}'")
+            new_columns.append(column)
+    return new_columns
 
-        new_columns = []
-        for column in df.columns:
-            if column in name_dict:
-                new_columns.append(name_dict[column].split(" ")[0])
+def create_dataframe(file, idx, table,config_json_path):
+    try:
+        plan = table_plan(config_json_path, table)
+        with stage("parse_excel") as record:
+            if idx == -1:
+                df = pd.read_excel(file)
             else:
-                print(f"Warning: Column '{column}' not found in the header mapping for table '{table}'")
-                new_columns.append(column)
-        df.columns = new_columns  
+                df = pd.read_excel(file, sheet_name=idx)
+            record["rows"] = len(df)
+            record["bytes"] = int(df.memory_usage(deep=True).sum())
+        with stage("map_columns", len(df)):
+            df.columns = map_columns(df.columns, plan.column_mapping, table)
         return df
     except Exception as e:
         print(f"Error creating DataFrame from file '{file}': {e}")
-        st.warning(f"Error creating DataFrame from file '{file}': {e}")
+        notify(f"Error creating DataFrame from file '{file}': {e}", warning=True)
         return None
 
+def _chunk_to_dataframe(rows, columns):
+    df = pd.DataFrame(rows, columns=columns)
+    for col in df.columns:
+        if pd.api.types.is_object_dtype(df[col]) or pd.api.types.is_string_dtype(df[col]):
+            df[col] = df[col].mask(df[col].isin(NA_STRINGS))
+    return df.infer_objects()
+
+def iter_dataframe_chunks(file, idx, table, config_json_path, chunk_size=10000):
+    # Stream the sheet with openpyxl read-only mode so only one chunk of rows is held in memory
+    plan = table_plan(config_json_path, table)
+    wb = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0 if idx == -1 else idx]
+        rows = ws.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        # Trailing empty header cells are formatting leftovers, not columns
+        while header and header[-1] is None:
+            header = header[:-1]
+        width = len(header)
+        columns = map_columns(header, plan.column_mapping, table)
+        chunk = []
+        for row in rows:
+            row = row[:width]
+            if all(value is None for value in row):
+                continue
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                yield _chunk_to_dataframe(chunk, columns)
+                chunk = []
+        if chunk:
+            yield _chunk_to_dataframe(chunk, columns)
+    finally:
+        wb.close()
+
 def table_exists(table_name, connection):
     cursor = connection.cursor()
     try:
@@ -38,127 +386,882 @@ def table_exists(table_name, connection):
         return count > 0
     except Exception as e:
         print("There is a problem with SQLite:", e)
-        st.warning("There is a problem with SQLite:", e)
+        notify(f"There is a problem with SQLite: {e}", warning=True)
         return False
     finally:
         cursor.close()
 
 def create_table(connection, table_name,config_json_path):
+    cursor = None
     try:
-        with open(config_json_path) as f:
-            config = json.load(f)
-        name_dict = config['header_mapping'][table_name]
-        column_definitions = []
-        for key, val in name_dict.items():
-            if key != "PRIMARY KEY":
-                column_definitions.append(val)
-        columns_str = ",\n    ".join(column_definitions)
+        query = table_plan(config_json_path, table_name).ddl
         cursor = connection.cursor()
-        query = f"""
-            CREATE TABLE {table_name} (
-                {columns_str},
-                PRIMARY KEY ({name_dict["PRIMARY KEY"]})
-            );
-            """
         print(query,"\n\n\n")
         cursor.execute(query)
         print(f"Table {table_name} created sucessfully!")
-        st.write(f"Table {table_name} created sucessfully!")
+        notify(f"Table {table_name} created sucessfully!")
         return True
     except sqlite3.DatabaseError as e:
         print("There is a problem with SQLite:", e)
-        st.write("Error creating table in database:",e)
+        notify(f"Error creating table in database: {e}")
         return False
     finally:
         if cursor:
             cursor.close()
 
-def upsert_batch(table_name, df, connection,config_json_path):
+def to_db_frame(df, types=None):
+    # Convert datetime columns to strings in one pass and missing values to NULL
+    out = df.copy()
+    types = types or {}
+    for col in out.columns:
+        sql_type = types.get(col, "")
+        if pd.api.types.is_datetime64_any_dtype(out[col]):
+            out[col] = out[col].dt.strftime('%Y-%m-%d %H:%M:%S')
+        elif 'INT' in sql_type and pd.api.types.is_float_dtype(out[col]) and (out[col].dropna() % 1 == 0).all():
+            # Store 5.0 as 5 like SQLite would, so the row hash does not depend on NaNs elsewhere in the chunk
+            out[col] = out[col].astype('Int64')
+        elif any(t in sql_type for t in ('REAL', 'FLOA', 'DOUB')) and pd.api.types.is_integer_dtype(out[col]):
+            out[col] = out[col].astype(float)
+    return out.astype(object).where(out.notna(), None)
+
+def row_hashes(db_frame):
+    # Signed 64 bit so the hash fits an SQLite INTEGER
+    return pd.util.hash_pandas_object(db_frame, index=False).values.view('int64').tolist()
+
+def ensure_catalog(cursor):
+    cursor.execute("CREATE TABLE IF NOT EXISTS _table_versions (table_name TEXT PRIMARY KEY, version INTEGER)")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS _column_stats (
+            table_name TEXT,
+            column_name TEXT,
+            min_value,
+            max_value,
+            null_count INTEGER,
+            capped INTEGER,
+            PRIMARY KEY (table_name, column_name)
+        )""")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS _column_values (
+            table_name TEXT,
+            column_name TEXT,
+            value,
+            count INTEGER,
+            PRIMARY KEY (table_name, column_name, value)
+        )""")
+
+def sqlite_affinity(sql_type):
+    # The type affinity SQLite derives from a declared column type
+    if 'INT' in sql_type:
+        return 'INTEGER'
+    if any(t in sql_type for t in ('CHAR', 'CLOB', 'TEXT')):
+        return 'TEXT'
+    if not sql_type or 'BLOB' in sql_type:
+        return 'BLOB'
+    if any(t in sql_type for t in ('REAL', 'FLOA', 'DOUB')):
+        return 'REAL'
+    return 'NUMERIC'
+
+def update_column_stats(cursor, table_name, stats_cols, added, removed, cap, types=None):
+    # added/removed hold the stats column values of rows written and of the rows they replaced.
+    # They go through a temp table with the columns' affinities, so values are counted as the table stores
+    # them and min/max follow SQLite's ordering of mixed types
+    if not stats_cols:
+        return
+    types = types or {}
+    delta = f"temp._stats_delta_{table_name}"
+    columns = ', '.join(f"{col} {sqlite_affinity(types.get(col, ''))}" for col in stats_cols)
+    cursor.execute(f"DROP TABLE IF EXISTS {delta}")
+    cursor.execute(f"CREATE TEMP TABLE _stats_delta_{table_name} (_sign INTEGER, {columns})")
+    cursor.executemany(f"INSERT INTO {delta} VALUES ({', '.join(['?'] * (len(stats_cols) + 1))})",
+                       [(1, *row) for row in added] + [(-1, *row) for row in removed])
+    for col in stats_cols:
+        cursor.execute(f"""
+            INSERT INTO _column_stats
+            SELECT ?, ?, MIN(CASE WHEN _sign > 0 THEN {col} END), MAX(CASE WHEN _sign > 0 THEN {col} END),
+                   COALESCE(SUM(CASE WHEN {col} IS NULL THEN _sign END), 0), 0 FROM {delta} WHERE true
+            ON CONFLICT (table_name, column_name) DO UPDATE SET
+                min_value = MIN(COALESCE(min_value, excluded.min_value), COALESCE(excluded.min_value, min_value)),
+                max_value = MAX(COALESCE(max_value, excluded.max_value), COALESCE(excluded.max_value, max_value)),
+                null_count = null_count + excluded.null_count""", (table_name, col))
+        capped = cursor.execute("SELECT capped FROM _column_stats WHERE table_name = ? AND column_name = ?",
+                                (table_name, col)).fetchone()[0]
+        if capped:
+            continue
+        cursor.execute(f"""
+            INSERT INTO _column_values SELECT ?, ?, {col}, SUM(_sign) FROM {delta} WHERE {col} IS NOT NULL GROUP BY {col}
+            ON CONFLICT (table_name, column_name, value) DO UPDATE SET count = count + excluded.count""", (table_name, col))
+        cursor.execute("DELETE FROM _column_values WHERE table_name = ? AND column_name = ? AND count <= 0", (table_name, col))
+        distinct = cursor.execute("SELECT COUNT(*) FROM _column_values WHERE table_name = ? AND column_name = ?",
+                                  (table_name, col)).fetchone()[0]
+        if distinct > cap:
+            # Too many values for a selectbox, keep only min/max and nulls for this column
+            cursor.execute("UPDATE _column_stats SET capped = 1 WHERE table_name = ? AND column_name = ?", (table_name, col))
+            cursor.execute("DELETE FROM _column_values WHERE table_name = ? AND column_name = ?", (table_name, col))
+
+def rebuild_column_stats(connection, table_name, config_json_path):
+    # Full scan, used once for tables loaded before the catalog existed
+    plan = load_plan(config_json_path)
+    cap = int(plan.db_config.get("stats_distinct_cap", 1000))
+    cursor = connection.cursor()
     try:
-        with open(config_json_path) as f:
-            config = json.load(f)
-        primary_keys = config['header_mapping'][table_name]['PRIMARY KEY'].split(",")
-        columns = df.columns.tolist()
-        cursor = connection.cursor()
+        ensure_catalog(cursor)
+        cursor.execute("DELETE FROM _column_stats WHERE table_name = ?", (table_name,))
+        cursor.execute("DELETE FROM _column_values WHERE table_name = ?", (table_name,))
+        for col in plan.tables[table_name].stats_columns:
+            lo, hi, nulls, distinct = cursor.execute(
+                f"SELECT MIN({col}), MAX({col}), COUNT(*) - COUNT({col}), COUNT(DISTINCT {col}) FROM {table_name}").fetchone()
+            cursor.execute("INSERT INTO _column_stats VALUES (?, ?, ?, ?, ?, ?)",
+                           (table_name, col, lo, hi, nulls, int(distinct > cap)))
+            if distinct <= cap:
+                cursor.execute(f"INSERT INTO _column_values SELECT ?, ?, {col}, COUNT(*) FROM {table_name} "
+                               f"WHERE {col} IS NOT NULL GROUP BY {col}", (table_name, col))
+        bump_table_version(cursor, table_name)
+        connection.commit()
+    except Exception as e:
+        connection.rollback()
+        print(f"Error building column statistics for {table_name}: {e}")
+    finally:
+        cursor.close()
 
-        try:
-            for _, row in df.iterrows():
-                # Convert Timestamps to strings
-                row = row.apply(lambda x: x.strftime('%Y-%m-%d %H:%M:%S') if isinstance(x, pd.Timestamp) else x)
-                
-                merge_sql = f"""
-                INSERT INTO {table_name} ({', '.join(columns)}) 
-                VALUES ({', '.join(['?' for _ in columns])})
-                ON CONFLICT({', '.join(primary_keys)}) DO UPDATE SET
-                {', '.join([f'{col} = excluded.{col}' for col in columns if col not in primary_keys])}
-                """
-                cursor.execute(merge_sql, tuple(row))
+def refresh_column_stats(connection, table_name, config_json_path):
+    # Incremental updates only widen min/max, tighten them with index lookups after an ingest
+    stats_cols = table_plan(config_json_path, table_name).stats_columns
+    cursor = connection.cursor()
+    try:
+        ensure_catalog(cursor)
+        tracked = {row[0] for row in cursor.execute("SELECT column_name FROM _column_stats WHERE table_name = ?", (table_name,))}
+        if set(stats_cols) - tracked:
+            rebuild_column_stats(connection, table_name, config_json_path)
+            return
+        for col in stats_cols:
+            cursor.execute(f"UPDATE _column_stats SET min_value = (SELECT MIN({col}) FROM {table_name}), "
+                           f"max_value = (SELECT MAX({col}) FROM {table_name}) WHERE table_name = ? AND column_name = ?",
+                           (table_name, col))
+        bump_table_version(cursor, table_name)
+        connection.commit()
+    except Exception as e:
+        connection.rollback()
+        print(f"Error refreshing column statistics for {table_name}: {e}")
+    finally:
+        cursor.close()
+
+def create_filter_indexes(connection, table_name, config_json_path):
+    # Index the view_mapping filter columns so filtered views use index range scans
+    try:
+        plan = table_plan(config_json_path, table_name)
+        table_cols = {row[1] for row in connection.execute(f"PRAGMA table_info({table_name})")}
+        # Skip indexes on columns an older version of the table does not have
+        indexes = {name: cols for name, cols in plan.indexes.items() if set(cols) <= table_cols}
+        existing = {row[0] for row in connection.execute(
+            "SELECT name FROM sqlite_master WHERE type='index' AND tbl_name=?", (table_name,))}
+        created = []
+        for name, cols in indexes.items():
+            if name not in existing:
+                connection.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table_name} ({', '.join(cols)})")
+                created.append(name)
+        if created:
+            connection.execute(f"ANALYZE {table_name}")
             connection.commit()
-            print("Merge Executed and changes committed!")
-            print(f"Sheet {table_name} upserted")
-            st.write(f"Sheet {table_name} data inserted/updated")
-        except Exception as e:
-            connection.rollback()
-            print(f"Error during upsert operation: {e}")
+            print(f"Created indexes on {table_name}: {', '.join(created)}")
+        return created
+    except Exception as e:
+        connection.rollback()
+        print(f"Error creating filter indexes for {table_name}: {e}")
+        return None
+
+@st.cache_resource(show_spinner=False)
+def indexed_tables():
+    # (database file, table) pairs whose filter indexes this server process has already checked
+    return set()
+
+def ensure_filter_indexes(config_json_path, table_name):
+    # Migrates tables loaded before their filter indexes existed, once per server process instead of on every rerun.
+    # The DDL goes through the writer so pooled readers never wait on an ingest's write lock
+    plan = load_plan(config_json_path)
+    key = (os.path.abspath(plan.db_path), table_name)
+    if key in indexed_tables():
+        return
+    writer = get_connection_manager(plan).writer(blocking=False)
+    if writer is None:
+        # An ingest holds the writer and builds the indexes itself when it finishes
+        return
+    try:
+        if create_filter_indexes(writer, table_name, config_json_path) is not None:
+            indexed_tables().add(key)
+    finally:
+        writer.close()
+
+@st.cache_resource(show_spinner=False)
+def cataloged_tables():
+    # (database file, table) pairs whose column statistics this server process has already built
+    return set()
+
+def ensure_column_stats(config_json_path, table_name):
+    # Builds the catalog of a table loaded before it existed, once per server process and through the writer
+    # like the filter indexes. Until it exists table_view falls back to scanning the table
+    plan = load_plan(config_json_path)
+    key = (os.path.abspath(plan.db_path), table_name)
+    if key in cataloged_tables():
+        return
+    writer = get_connection_manager(plan).writer(blocking=False)
+    if writer is None:
+        return
+    try:
+        refresh_column_stats(writer, table_name, config_json_path)
+        cataloged_tables().add(key)
+    finally:
+        writer.close()
+
+def format_counts(counts):
+    text = f"{counts['inserted']} inserted, {counts['updated']} updated, {counts['skipped']} skipped"
+    if counts['duplicates']:
+        text += f", {counts['duplicates']} superseded by a later row with the same key"
+    return text
+
+def loaded_cleanly(counts):
+    # Only a table that received rows without failed rows or parse errors may be recorded in the ledger
+    return (counts['inserted'] + counts['updated'] + counts['skipped'] + counts['duplicates'] > 0
+            and not counts['failed'] and not counts['errors'])
+
+def merge_staged(cursor, table_name, plan, columns, rows, hashes, stats_cols, cap):
+    # Set-based merge of one batch: bulk-load it into an unconstrained temp table, drop rows whose hash
+    # is unchanged, then apply a single INSERT ... SELECT upsert. upsert_batch has already removed repeated keys
+    counts = Counter(inserted=0, updated=0, skipped=0)
+    staging = f"temp._staging_{table_name}"
+    join_on = " AND ".join(f"t.{key} = s.{key}" for key in plan.primary_keys)
+    with stage("staging_load", len(rows)):
+        cursor.execute(f"DROP TABLE IF EXISTS {staging}")
+        cursor.execute(f"CREATE TEMP TABLE _staging_{table_name} ({', '.join(columns)}, {ROW_HASH_COLUMN})")
+        cursor.executemany(f"INSERT INTO {staging} VALUES ({', '.join(['?'] * (len(columns) + 1))})",
+                           [(*row, h) for row, h in zip(rows, hashes)])
+    with stage("staging_diff", len(rows)):
+        cursor.execute(f"DELETE FROM {staging} AS s WHERE EXISTS (SELECT 1 FROM {table_name} t WHERE {join_on} "
+                       f"AND t.{ROW_HASH_COLUMN} = s.{ROW_HASH_COLUMN})")
+        counts['skipped'] += cursor.rowcount
+        replaced = cursor.execute(f"SELECT {', '.join(['t.' + col for col in stats_cols] or ['1'])} "
+                                  f"FROM {staging} s JOIN {table_name} t ON {join_on}").fetchall()
+        changed = cursor.execute(f"SELECT COUNT(*) FROM {staging}").fetchone()[0]
+        counts['updated'] += len(replaced)
+        counts['inserted'] += changed - len(replaced)
+    if changed:
+        with stage("sql_write", changed):
+            cursor.execute(build_upsert_sql(table_name, columns + (ROW_HASH_COLUMN,), plan.primary_keys, source=staging))
+        with stage("column_stats", changed):
+            added = cursor.execute(f"SELECT {', '.join(stats_cols) or '1'} FROM {staging}").fetchall()
+            update_column_stats(cursor, table_name, stats_cols, added, replaced, cap, plan.column_types)
+        bump_table_version(cursor, table_name)
+    cursor.execute(f"DELETE FROM {staging}")
+    return counts
+
+def upsert_batch(table_name, df, connection,config_json_path,batch_size=1000,report=True):
+    # Returns a Counter of inserted, updated, skipped (unchanged), duplicate-key and failed rows
+    counts = Counter(inserted=0, updated=0, skipped=0, failed=0)
+    cursor = None
+    try:
+        plan = table_plan(config_json_path, table_name)
+        db_config = load_plan(config_json_path).db_config
+        cap = int(db_config.get("stats_distinct_cap", 1000))
+        # Both modes commit batch_size rows at a time; "staging" merges each batch set-based through a temp table,
+        # "batch" (default) with a per-row upsert
+        staged = db_config.get("merge_mode", "batch") == "staging"
+        columns = tuple(df.columns)
+        stats_cols = [col for col in plan.stats_columns if col in columns]
+        stats_idx = [columns.index(col) for col in stats_cols]
+        if columns == plan.columns:
+            merge_sql = plan.upsert_sql
+        else:
+            merge_sql = build_upsert_sql(table_name, columns + (ROW_HASH_COLUMN,), plan.primary_keys)
+        key_idx = [columns.index(key) for key in plan.primary_keys]
+        key_cols = [f"k{i}" for i in range(len(key_idx))]
+        keys_table = f"temp._ingest_keys_{table_name}"
+        join_on = " AND ".join(f"t.{key} = k.{col}" for key, col in zip(plan.primary_keys, key_cols))
+        batch_size = int(batch_size or 1000)
+        report_progress(len(df))
+        # A key repeated in the sheet keeps only its last row, as sequential upserts would
+        repeated = df.duplicated(list(plan.primary_keys), keep='last')
+        counts['duplicates'] = int(repeated.sum())
+        if counts['duplicates']:
+            df = df[~repeated.values]
+            report_progress(counts['duplicates'], Counter(duplicates=counts['duplicates']))
+        cursor = connection.cursor()
+        ensure_catalog(cursor)
+        cursor.execute(f"CREATE TEMP TABLE IF NOT EXISTS _ingest_keys_{table_name} (seq, {', '.join(key_cols)}, row_hash)")
+        start = time.perf_counter()
+        for i in range(0, len(df), batch_size):
+            # Convert and hash one batch at a time so the whole sheet is never copied
+            with stage("prepare_rows", min(batch_size, len(df) - i)):
+                db_batch = to_db_frame(df.iloc[i:i + batch_size], plan.column_types)
+                batch = list(db_batch.itertuples(index=False, name=None))
+                batch_hashes = row_hashes(db_batch)
+            try:
+                if staged:
+                    batch_counts = merge_staged(cursor, table_name, plan, columns, batch, batch_hashes, stats_cols, cap)
+                else:
+                    # Look up the stored hashes of this batch's keys to find new and changed rows
+                    with stage("sql_lookup", len(batch)):
+                        cursor.execute(f"DELETE FROM {keys_table}")
+                        cursor.executemany(f"INSERT INTO {keys_table} VALUES ({', '.join(['?'] * (len(key_cols) + 2))})",
+                                           [(j, *[row[k] for k in key_idx], h) for j, (row, h) in enumerate(zip(batch, batch_hashes))])
+                        stored = {row[0]: row[1:] for row in cursor.execute(
+                            f"SELECT k.seq, t.{ROW_HASH_COLUMN}{''.join(f', t.{col}' for col in stats_cols)} FROM {keys_table} k JOIN {table_name} t ON {join_on}")}
+                    changed = []
+                    replaced = []
+                    batch_counts = Counter(inserted=0, updated=0, skipped=0)
+                    for j, (row, h) in enumerate(zip(batch, batch_hashes)):
+                        if j not in stored:
+                            batch_counts['inserted'] += 1
+                        elif stored[j][0] != h:
+                            batch_counts['updated'] += 1
+                            replaced.append(stored[j][1:])
+                        else:
+                            batch_counts['skipped'] += 1
+                            continue
+                        changed.append(row + (h,))
+                    if changed:
+                        with stage("sql_write", len(changed)):
+                            cursor.executemany(merge_sql, changed)
+                        with stage("column_stats", len(changed)):
+                            update_column_stats(cursor, table_name, stats_cols,
+                                                [tuple(row[k] for k in stats_idx) for row in changed], replaced, cap, plan.column_types)
+                        bump_table_version(cursor, table_name)
+                # A cancelled job stops here, before this batch is committed
+                check_cancelled()
+                with stage("commit", batch_counts['inserted'] + batch_counts['updated']):
+                    connection.commit()
+                counts.update(batch_counts)
+                report_progress(len(batch), batch_counts)
+            except IngestCancelled:
+                connection.rollback()
+                raise
+            except Exception as e:
+                connection.rollback()
+                counts['failed'] += len(batch)
+                report_progress(len(batch), Counter(failed=len(batch)))
+                print(f"Error during upsert of rows {i} to {i + len(batch) - 1}: {e}")
+        elapsed = time.perf_counter() - start
+        processed = len(df) - counts['failed']
+        rate = processed / elapsed if elapsed > 0 else 0
+        print("Merge Executed and changes committed!")
+        print(f"Sheet {table_name} upserted: {format_counts(counts)} in {elapsed:.2f}s ({rate:,.0f} rows/s), {counts['failed']} rows failed")
+        if report:
+            notify(f"Sheet {table_name} data inserted/updated: {format_counts(counts)} ({rate:,.0f} rows/s)")
+        if counts['failed']:
+            notify(f"{counts['failed']} rows of sheet {table_name} could not be upserted", warning=True)
+    except IngestCancelled:
+        raise
     except Exception as e:
         print(f"Error: {e}")
+        counts['failed'] += len(df)
     finally:
         if cursor:
             cursor.close()
+    return counts
 
-def connect_to_db(config_pth):
-    with open(config_pth) as f:
-        config = json.load(f)
-    creds = config['db_config']
-    table_name = creds.get("table_name").split(",")
-    batch_size = creds.get("batch_size")
-    db_path = creds.get("db_path")
+def compact_frame(df):
+    # Repetitive strings become categoricals and numbers take the smallest dtype that holds them exactly
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series):
+            if len(series) and series.nunique() <= len(series) // 2:
+                df[col] = series.astype('category')
+        elif pd.api.types.is_integer_dtype(series):
+            df[col] = pd.to_numeric(series, downcast='integer')
+        elif pd.api.types.is_float_dtype(series):
+            narrow = series.astype('float32')
+            if narrow.astype('float64').equals(series):
+                df[col] = narrow
+    return df
+
+class SnapshotCache:
+    # LRU of compact query results, bounded by their in-memory size
+    def __init__(self, budget_bytes):
+        self.budget = budget_bytes
+        self.used = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key][0]
+        return None
+
+    def put(self, key, df):
+        size = int(df.memory_usage(deep=True).sum())
+        if size > self.budget:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.used -= self._entries.pop(key)[1]
+            while self._entries and self.used + size > self.budget:
+                self.used -= self._entries.popitem(last=False)[1][1]
+            self._entries[key] = (df, size)
+            self.used += size
+
+def bump_table_version(cursor, table_name):
+    # A fresh stamp per write, so cached snapshots of a deleted and recreated database never match
+    cursor.execute("INSERT INTO _table_versions VALUES (?, ?) ON CONFLICT(table_name) DO UPDATE SET version = excluded.version",
+                   (table_name, time.time_ns()))
+
+def table_version(connection, table_name):
     try:
-        connection = sqlite3.connect(db_path)
-        print("Connected to database!")
-    except Exception as e:
-        print(e)
-        connection.close()
+        row = connection.execute("SELECT version FROM _table_versions WHERE table_name = ?", (table_name,)).fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return row[0] if row else 0
+
+def cached_query(connection, table_name, query, params=()):
+    # Results stay valid until an ingest bumps the table version; callers must not modify them
+    cache = getattr(getattr(connection, "manager", None), "snapshots", None)
+    if cache is None:
+        return compact_frame(pd.read_sql(query, con=connection, params=list(params)))
+    key = (table_name, table_version(connection, table_name), query, tuple(params))
+    df = cache.get(key)
+    if df is None:
+        df = compact_frame(pd.read_sql(query, con=connection, params=list(params)))
+        cache.put(key, df)
+    return df
+
+def first_row(df):
+    # Plain Python values for widgets, NULL as None
+    row = df.astype(object).iloc[0]
+    return row.where(row.notna(), None).tolist()
+
+# Tuned defaults, any key can be overridden through db_config["pragmas"]
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -65536,
+    "mmap_size": 268435456,
+    "temp_store": "MEMORY",
+    "busy_timeout": 30000,
+}
+
+class PooledConnection(sqlite3.Connection):
+    # close() hands the connection back to its manager instead of closing it
+    manager = None
+
+    def close(self):
+        if self.manager is None:
+            super().close()
+        else:
+            self.manager.release(self)
+
+    def real_close(self):
+        super().close()
+
+class ConnectionManager:
+    # Long-lived tuned connections for one database: a pool of readers and a single locked writer
+    def __init__(self, db_path, pragmas, pool_size=4, snapshot_budget=256 * 2**20):
+        self.db_path = db_path
+        self.pragmas = pragmas
+        self.pool_size = pool_size
+        self.snapshots = SnapshotCache(snapshot_budget)
+        self._idle = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.RLock()
+        self._writer = None
+
+    def _open(self):
+        connection = sqlite3.connect(self.db_path, factory=PooledConnection, check_same_thread=False)
+        for key, value in self.pragmas.items():
+            connection.execute(f"PRAGMA {key} = {value}")
+        connection.manager = self
+        return connection
+
+    def reader(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return self._open()
+
+    def writer(self, blocking=True):
+        # Waits until any other ingest on this database has released the writer, or returns None when not blocking
+        if not self._write_lock.acquire(blocking=blocking):
+            return None
+        if self._writer is None:
+            try:
+                self._writer = self._open()
+            except Exception:
+                self._write_lock.release()
+                raise
+        return self._writer
+
+    def release(self, connection):
+        if connection.in_transaction:
+            connection.rollback()
+        if connection is self._writer:
+            self._write_lock.release()
+            return
+        with self._lock:
+            if len(self._idle) < self.pool_size:
+                self._idle.append(connection)
+                return
+        connection.real_close()
+
+@st.cache_resource(show_spinner=False)
+def _connection_manager(db_path, pragmas, snapshot_cache_mb):
+    return ConnectionManager(db_path, dict(pragmas), snapshot_budget=int(snapshot_cache_mb * 2**20))
+
+def get_connection_manager(plan):
+    pragmas = {**DEFAULT_PRAGMAS, **dict(plan.db_config.get("pragmas") or {})}
+    return _connection_manager(os.path.abspath(plan.db_path), tuple(sorted(pragmas.items())),
+                               plan.db_config.get("snapshot_cache_mb", 256))
+
+def connect_to_db(config_pth, write=False):
+    # The returned connection is pooled: close() gives it back for the next caller
+    plan = load_plan(config_pth)
+    table_name = list(plan.table_names)
+    batch_size = plan.batch_size
+    manager = get_connection_manager(plan)
+    connection = manager.writer() if write else manager.reader()
+    print("Connected to database!")
     return connection, table_name, batch_size
 
-def insert_xls_to_database(file,config_json_path):
+def read_file_bytes(file):
+    if hasattr(file, "getvalue"):
+        return file.getvalue()
+    if hasattr(file, "read"):
+        return file.read()
+    with open(file, "rb") as f:
+        return f.read()
+
+def parse_sheet_worker(file_bytes, idx, table, config_json_path, streaming, chunk_size, queue):
+    # Runs in a worker process: parse one sheet and queue its rows for the single writer.
+    # A parse error is queued as a message so the writer can report the table as failed
     try:
-        connection, table_name, batch_size = connect_to_db(config_json_path)
+        if streaming:
+            for df in iter_dataframe_chunks(io.BytesIO(file_bytes), idx, table, config_json_path, chunk_size):
+                queue.put((table, df))
+        else:
+            df = create_dataframe(io.BytesIO(file_bytes), idx, table, config_json_path)
+            # create_dataframe reports its own errors and returns None
+            queue.put((table, df if df is not None else f"Sheet {idx} for table '{table}' could not be read"))
     except Exception as e:
-        print(f"Error in database connection: {e}")
+        print(f"Error parsing sheet {idx} for table '{table}': {e}")
+        queue.put((table, f"Error parsing sheet {idx} for table '{table}': {e}"))
+    finally:
+        queue.put((table, None))
+
+def parse_workbook_worker(path, table_names, config_json_path):
+    # Runs in a worker process: parse every configured sheet of one workbook file
+    with instrumented_run(f"parse {os.path.basename(path)}") as run:
+        sheets = []
+        for idx, table in enumerate(table_names):
+            df = create_dataframe(path, -1 if len(table_names) == 1 else idx, table, config_json_path)
+            if df is not None:
+                sheets.append((table, df))
+    return sheets, run.summary()
+
+def file_fingerprint(file):
+    digest = hashlib.sha256()
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    else:
+        digest.update(read_file_bytes(file))
+        if hasattr(file, "seek"):
+            file.seek(0)
+    return digest.hexdigest()
+
+def ledger_key(file_hash, plan):
+    # A changed table definition must not match an earlier ingest of the same file
+    return hashlib.sha256((file_hash + plan.ddl).encode()).hexdigest()
+
+def ensure_ledger(connection):
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS _ingest_ledger (
+            file_hash TEXT,
+            table_name TEXT,
+            inserted INTEGER,
+            updated INTEGER,
+            skipped INTEGER,
+            ingested_at TEXT,
+            PRIMARY KEY (file_hash, table_name)
+        )""")
+    connection.commit()
+
+def file_already_ingested(connection, file_hash, table_names, config_json_path):
+    plan = load_plan(config_json_path)
+    for table in table_names:
+        found = connection.execute("SELECT 1 FROM _ingest_ledger WHERE file_hash = ? AND table_name = ?",
+                                   (ledger_key(file_hash, plan.tables[table]), table)).fetchone()
+        if found is None:
+            return False
+    return True
+
+def record_ingest(connection, file_hash, table_name, counts, config_json_path):
+    connection.execute("INSERT OR REPLACE INTO _ingest_ledger VALUES (?, ?, ?, ?, ?, ?)",
+                       (ledger_key(file_hash, table_plan(config_json_path, table_name)), table_name,
+                        counts['inserted'], counts['updated'], counts['skipped'], datetime.now().isoformat(timespec='seconds')))
+    connection.commit()
+
+def prepare_table(connection, table_name, config_json_path):
+    if not table_exists(table_name, connection):
+        if not create_table(connection, table_name,config_json_path):
+            print(f"Table {table_name} does not exist and failed to create.")
+            return False
+        print(f"Table {table_name} created successfully!")
+    else:
+        notify(f"Table {table_name} already exists, updating table contents!")
+        table_cols = {row[1] for row in connection.execute(f"PRAGMA table_info({table_name})")}
+        if ROW_HASH_COLUMN not in table_cols:
+            # Tables created before row hashing: every row counts as changed on the first ingest
+            connection.execute(f"ALTER TABLE {table_name} ADD COLUMN {ROW_HASH_COLUMN} INTEGER")
+            connection.commit()
+    return True
+
+def finish_tables(connection, table_names, config_json_path):
+    # Indexes are built after the load so a fresh table is not indexed row by row
+    for table in table_names:
+        if table_exists(table, connection):
+            with stage("create_indexes"):
+                create_filter_indexes(connection, table, config_json_path)
+            with stage("refresh_column_stats"):
+                refresh_column_stats(connection, table, config_json_path)
+    # Refresh planner statistics for tables whose size changed noticeably
+    with stage("optimize"):
+        connection.execute("PRAGMA optimize")
+
+def insert_sheets_parallel(file, table_names, connection, config_json_path, batch_size, streaming, chunk_size, workers):
+    file_bytes = read_file_bytes(file)
+    totals = {table: Counter() for table in table_names}
+    tables = [table for table in table_names if prepare_table(connection, table, config_json_path)]
+    for table in set(table_names) - set(tables):
+        totals[table]['errors'] += 1
+    workers = max(1, min(int(workers or os.cpu_count() or 1), len(tables)))
+    # Forking a multi-threaded process such as the Streamlit server can deadlock, so workers are spawned
+    context = multiprocessing.get_context("spawn")
+    with context.Manager() as manager, ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        # Bounded queue so parsers wait for the writer instead of piling up parsed sheets
+        queue = manager.Queue(maxsize=workers * 2)
+        futures = [executor.submit(parse_sheet_worker, file_bytes, table_names.index(table), table,
+                                   config_json_path, streaming, chunk_size, queue) for table in tables]
+        pending = set(tables)
+        try:
+            while pending:
+                try:
+                    # Time blocked here means the writer is waiting on the parsers
+                    with stage("wait_for_parse"):
+                        table, df = queue.get(timeout=1)
+                except Empty:
+                    if all(future.done() for future in futures) and queue.empty():
+                        print(f"Workers exited before finishing tables: {', '.join(pending)}")
+                        for table in pending:
+                            totals[table]['errors'] += 1
+                        break
+                    continue
+                if df is None:
+                    pending.discard(table)
+                elif isinstance(df, str):
+                    totals[table]['errors'] += 1
+                    notify(df, warning=True)
+                else:
+                    totals[table] += upsert_batch(table, df, connection,config_json_path,batch_size,report=False)
+        except IngestCancelled:
+            # Drain the queue so parsers blocked on it can exit and the pool can shut down
+            for future in futures:
+                future.cancel()
+            while not all(future.done() for future in futures):
+                try:
+                    queue.get(timeout=0.2)
+                except Empty:
+                    pass
+            raise
+    for table, total in totals.items():
+        if total['errors']:
+            print(f"Sheet {table} was not loaded completely: {format_counts(total)}")
+            report_progress(0, Counter(errors=total['errors']))
+            notify(f"Sheet {table} was not loaded completely: {format_counts(total)}", warning=True)
+        else:
+            print(f"Sheet {table} upserted: {format_counts(total)}")
+            notify(f"Sheet {table} data inserted/updated: {format_counts(total)}")
+    return totals
+
+def ingest_file(connection, file, config_json_path, table_name, batch_size, creds):
+    streaming = creds.get("streaming", False)
+    chunk_size = int(creds.get("chunk_size", 50000))
+    workers = creds.get("workers")
+    ensure_ledger(connection)
+    with stage("fingerprint") as record:
+        file_hash = file_fingerprint(file)
+        record["bytes"] = getattr(file, "size", None) or (os.path.getsize(file) if isinstance(file, str) else 0)
+    if file_already_ingested(connection, file_hash, table_name, config_json_path):
+        print("File unchanged since its last ingest, skipping")
+        notify("This file was already ingested and has not changed, nothing to update.")
         return
-    try:
-        if len(table_name) == 1:
+    if len(table_name) == 1:
+        if not prepare_table(connection, table_name[0], config_json_path):
+            return
+        if streaming:
+            total = Counter()
+            chunks = iter_dataframe_chunks(file, -1, table_name[0], config_json_path, chunk_size)
+            for df in timed_chunks(chunks, "parse_excel"):
+                total += upsert_batch(table_name[0], df, connection,config_json_path,batch_size,report=False)
+            print(f"Sheet {table_name[0]} streamed: {format_counts(total)}")
+            notify(f"Sheet {table_name[0]} data inserted/updated: {format_counts(total)}")
+        else:
             df = create_dataframe(file, -1, table_name[0],config_json_path)
             if df is not None:
-                if not table_exists(table_name[0], connection):
-                    if not create_table(connection, table_name[0],config_json_path):
-                        print(f"Table {table_name[0]} does not exist and failed to create.")
-                        return
-                    else:
-                        print(f"Table {table_name[0]} created successfully!")
-                        upsert_batch(table_name[0], df, connection,config_json_path)
-                else:
-                    st.write(f"Table {table_name[0]} already exists, updating table contents!")
-                    upsert_batch(table_name[0], df, connection,config_json_path)
+                total = upsert_batch(table_name[0], df, connection,config_json_path,batch_size)
             else:
                 print("Empty dataframe !")
-        # else:    
-        #     for i in range(len(table_name)):
-        #         df = create_dataframe(file, i, table_name[i])
-        #         if df is not None:
-        #             if not table_exists(table_name[i], connection):
-        #                 if not create_table(connection, table_name[i]):
-        #                     print(f"Table {table_name[i]} does not exist and failed to create.")
-        #                     return
-        #             else:
-        #                 st.write(f"Table {table_name[i]}, already exists, updating table contents!")
-        #                 upsert_batch(table_name[i], df, connection)
+                return
+        totals = {table_name[0]: total}
+    else:
+        totals = insert_sheets_parallel(file, table_name, connection, config_json_path, batch_size, streaming, chunk_size, workers)
+    finish_tables(connection, table_name, config_json_path)
+    for table, total in totals.items():
+        # Only a complete load may mark the file as ingested
+        if loaded_cleanly(total):
+            record_ingest(connection, file_hash, table, total, config_json_path)
+
+def insert_xls_to_database(file,config_json_path):
+    # Returns the run metrics, or None when the database could not be opened
+    try:
+        connection, table_name, batch_size = connect_to_db(config_json_path, write=True)
+        creds = load_plan(config_json_path).db_config
+    except Exception as e:
+        print(f"Error in database connection: {e}")
+        notify(f"Error in database connection: {e}", warning=True)
+        return None
+    run = None
+    try:
+        with instrumented_run("ingest", creds) as run:
+            ingest_file(connection, file, config_json_path, table_name, batch_size, creds)
+    except IngestCancelled:
+        print("Ingest cancelled, the batch in progress was rolled back")
+        notify("Cancelled: batches committed before the cancel are kept, the batch in progress was rolled back.", warning=True)
     except Exception as e:
         print(f"Error in inserting data to database: {e}")
+        notify(f"Error in inserting data to database: {e}", warning=True)
     finally:
         if connection:
             connection.close()
+    return run
+
+def count_sheet_rows(file, table_names):
+    # Data rows of the sheets an ingest will read, from the sheet dimensions; None when unknown
+    wb = openpyxl.load_workbook(file, read_only=True)
+    try:
+        sheets = [wb.worksheets[0]] if len(table_names) == 1 else wb.worksheets[:len(table_names)]
+        sizes = [ws.max_row for ws in sheets]
+    finally:
+        wb.close()
+    if any(size is None for size in sizes):
+        return None
+    return sum(max(size - 1, 0) for size in sizes)
+
+class IngestJob:
+    # State of one background ingest, read by the UI while the job thread updates it
+    def __init__(self, file_name, file_bytes, config_json_path):
+        self.id = uuid.uuid4().hex[:8]
+        self.file_name = file_name
+        self.file_bytes = file_bytes
+        self.config_json_path = config_json_path
+        self.status = "queued"
+        self.rows_total = None
+        self.rows_parsed = 0
+        self.rows_done = 0
+        self.counts = Counter()
+        self.messages = []
+        self.run = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.cancel_event = threading.Event()
+        self.future = None
+
+    def active(self):
+        return self.status in ("queued", "running")
+
+    def cancel(self):
+        self.cancel_event.set()
+        if self.future is not None and self.future.cancel():
+            self.status = "cancelled"
+            self.file_bytes = None
+
+    def log(self, message):
+        self.messages.append(message)
+
+    def advance(self, rows, counts):
+        self.rows_done += rows
+        self.counts.update(counts)
+
+    def fraction(self):
+        # Sheets saved without their dimensions have no known size, so fall back to the rows parsed so far
+        total = self.rows_total or self.rows_parsed
+        if not total:
+            return 0.0
+        return min(1.0, self.rows_done / total)
+
+    def progress_text(self):
+        if self.rows_total:
+            text = f"{self.rows_done:,} of {self.rows_total:,} rows"
+        elif self.rows_parsed:
+            text = f"{self.rows_done:,} of {self.rows_parsed:,} parsed rows"
+        else:
+            text = "reading the workbook"
+        if self.started and self.rows_done and self.rows_total and self.rows_done < self.rows_total:
+            elapsed = time.time() - self.started
+            text += f", about {elapsed / self.rows_done * (self.rows_total - self.rows_done):.0f}s left"
+        return text
+
+def run_ingest_job(job):
+    # Runs on a registry thread in a fresh context, so the job and its run metrics stay private to it
+    if job.cancel_event.is_set():
+        job.status = "cancelled"
+        return
+    _current_job.set(job)
+    job.status = "running"
+    job.started = time.time()
+    try:
+        file = io.BytesIO(job.file_bytes)
+        try:
+            job.rows_total = count_sheet_rows(file, load_plan(job.config_json_path).table_names)
+        except Exception as e:
+            print(f"Could not size {job.file_name}: {e}")
+        file.seek(0)
+        job.run = insert_xls_to_database(file, job.config_json_path)
+        if job.cancel_event.is_set():
+            job.status = "cancelled"
+        elif job.run is None or job.counts['failed'] or job.counts['errors']:
+            job.status = "failed"
+        else:
+            job.status = "done"
+    except Exception as e:
+        print(f"Error in ingest job {job.id}: {e}")
+        job.log(f"Error in ingest job: {e}")
+        job.status = "failed"
+    finally:
+        job.file_bytes = None
+        job.finished = time.time()
+
+class JobRegistry:
+    # Background ingest jobs shared by every session; loads on one database still take turns on its writer
+    def __init__(self, max_workers=2, keep=50):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self.keep = keep
+        self.jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, file_name, file_bytes, config_json_path):
+        job = IngestJob(file_name, file_bytes, config_json_path)
+        with self._lock:
+            self.jobs[job.id] = job
+            for job_id in [job_id for job_id, old in self.jobs.items() if not old.active()][:max(0, len(self.jobs) - self.keep)]:
+                del self.jobs[job_id]
+        job.future = self.executor.submit(contextvars.Context().run, run_ingest_job, job)
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+@st.cache_resource(show_spinner=False)
+def job_registry():
+    return JobRegistry()
 
 def main():
     st.title('EXCEL DATABASE CONNECTION APPLICATION')
@@ -175,8 +1278,10 @@ def main():
             config_json_file = st.file_uploader("Select Config file for your Excel database", type=['json'])
             if config_json_file is not None:
                 config_json_path = os.path.join(RELATIVE_PATH, config_json_file.name)
-                with open(config_json_path, "wb") as f:
-                    f.write(config_json_file.getbuffer())
+                # Rewriting an unchanged file would bump its mtime and invalidate the cached plan
+                if not os.path.exists(config_json_path) or read_file_bytes(config_json_path) != config_json_file.getvalue():
+                    with open(config_json_path, "wb") as f:
+                        f.write(config_json_file.getbuffer())
                 st.success(f"File saved at: {config_json_path}")
             if tab_selection == 'Create/Update Database':
                 insert_file_tab(config_json_path)
@@ -195,11 +1300,17 @@ def generate_config_file():
         st.session_state['file'] = None
 
     st.session_state['file'] = st.file_uploader("Upload your Excel file", type=['xlsx'], key="file_uploader")
+    sample_rows = st.number_input("Rows to sample for type inference", min_value=100, value=1000, step=100, key="sample_rows_input")
+    scan_rows = st.number_input("Rows to scan at most while sampling", min_value=sample_rows, value=max(50000, sample_rows), step=10000, key="scan_rows_input")
 
     if st.session_state['file'] is not None and st.button('Generate', key="generate_button"):
         try:
-            df = pd.read_excel(st.session_state['file'])
+            # Only a sample of the sheet is read and kept in session state, never the whole workbook
+            df, scanned, complete = sample_sheet(st.session_state['file'], sample_rows, scan_rows)
             st.session_state['df'] = df
+            st.session_state['inferred_types'] = {col: infer_default_type(df[col].tolist()) for col in df.columns}
+            st.session_state['pk_candidates'] = primary_key_candidates(df, st.session_state['inferred_types'])
+            st.session_state['sample_info'] = f"Types inferred from {len(df)} of {scanned} rows" + ("" if complete else f" (the first {scanned} rows of the sheet)")
             config_select()
         except Exception as e:
             st.write(f"Error in reading xls file while generating config file: {e}")
@@ -207,24 +1318,126 @@ def generate_config_file():
     elif 'df' in st.session_state:
         config_select()
 
-def infer_default_type(pandas_dtype):
-    # Infer default data type from Pandas dtype
-    if pd.api.types.is_bool_dtype(pandas_dtype):
+def sample_sheet(file, sample_rows=1000, scan_rows=50000):
+    # Header plus the first half of the sample, then evenly spaced rows of the rest of the sheet, ending at the last one.
+    # The stride doubles whenever the tail fills up, so memory stays bounded without knowing the row count,
+    # and parsing stops after scan_rows rows so the cost is bounded on very large sheets.
+    wb = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return pd.DataFrame(), 0, True
+        while header and header[-1] is None:
+            header = header[:-1]
+        width = len(header)
+        sample_rows = max(1, int(sample_rows))
+        head_size = sample_rows // 2
+        tail_size = sample_rows - head_size
+        head, tail = [], []
+        last = None
+        stride = 1
+        scanned = 0
+        complete = True
+        for row in rows:
+            if scanned >= scan_rows:
+                complete = False
+                break
+            row = row[:width]
+            if all(value is None for value in row):
+                continue
+            if scanned < head_size:
+                head.append(row)
+            else:
+                last = row
+                if (scanned - head_size) % stride == 0:
+                    tail.append(row)
+                    if len(tail) >= tail_size * 2:
+                        tail = tail[::2]
+                        stride *= 2
+            scanned += 1
+    finally:
+        wb.close()
+    # Strided sampling can skip the final rows, so always keep the last one read
+    if last is not None and tail[-1] is not last:
+        tail.append(last)
+    if len(tail) > tail_size:
+        # Thin to evenly spaced rows that still reach the last one read, rather than cutting off the end
+        step = len(tail) / tail_size
+        tail = [tail[len(tail) - 1 - int(k * step)] for k in reversed(range(tail_size))]
+    return pd.DataFrame(head + tail, columns=sample_columns(header), dtype=object), scanned, complete
+
+def sample_columns(header):
+    # Same names pd.read_excel gives blank and repeated headers
+    columns = []
+    seen = Counter()
+    for i, name in enumerate(header):
+        name = f"Unnamed: {i}" if name is None else str(name)
+        if seen[name]:
+            columns.append(f"{name}.{seen[name]}")
+        else:
+            columns.append(name)
+        seen[name] += 1
+    return columns
+
+BOOL_STRINGS = {'true', 'false', 'yes', 'no'}
+DATE_STRING = re.compile(r'^\d{4}-\d{2}-\d{2}([ T]\d{2}:\d{2}(:\d{2}(\.\d+)?)?)?$')
+
+def infer_default_type(values):
+    # Infer default data type from sampled cell values
+    values = [value.strip() if isinstance(value, str) else value for value in values]
+    values = [value for value in values if value is not None and not (isinstance(value, str) and value in NA_STRINGS)
+              and not (isinstance(value, float) and value != value)]
+    if not values:
+        return 'Categorical/String'
+    if all(isinstance(value, bool) or (isinstance(value, str) and value.lower() in BOOL_STRINGS) for value in values):
         return 'True/False'
-    elif pd.api.types.is_integer_dtype(pandas_dtype):
-        return 'Number'
-    elif pd.api.types.is_float_dtype(pandas_dtype):
-        return 'Decimal point Number'
-    elif pd.api.types.is_datetime64_any_dtype(pandas_dtype):
+    if all(isinstance(value, datetime) or (isinstance(value, str) and DATE_STRING.match(value)) for value in values):
         return 'DATE'
-    else:
-        return 'Categorical/String'  # Default to Categorical/String if unable to infer
+    integral = True
+    for value in values:
+        if isinstance(value, bool):
+            return 'Categorical/String'
+        if isinstance(value, str):
+            # Codes with leading zeros such as zip codes lose information as numbers
+            if len(value) > 1 and value[0] == '0' and value[1] != '.':
+                return 'Categorical/String'
+            try:
+                value = float(value)
+            except ValueError:
+                return 'Categorical/String'
+        elif not isinstance(value, (int, float)):
+            return 'Categorical/String'
+        if value != value or value in (float('inf'), float('-inf')):
+            return 'Categorical/String'
+        integral = integral and float(value).is_integer()
+    return 'Number' if integral else 'Decimal point Number'
+
+def primary_key_candidates(df, inferred_types, max_columns=12):
+    # Columns, then pairs of columns, whose values are complete and unique in the sample.
+    # Uniqueness in a sample is necessary but not sufficient, so these are only suggestions.
+    if df.empty:
+        return []
+    keyable = [col for col in df.columns[:max_columns]
+               if inferred_types.get(col) not in ('Decimal point Number', 'True/False') and df[col].notna().all()]
+    candidates = [(col,) for col in keyable if df[col].is_unique]
+    if not candidates:
+        candidates = [(a, b) for i, a in enumerate(keyable) for b in keyable[i + 1:]
+                      if not df.duplicated([a, b]).any()]
+    pro_cols = dict(zip(df.columns, processed_columns(df.columns)))
+    return [[pro_cols[col] for col in candidate] for candidate in candidates[:5]]
+
+def processed_columns(columns):
+    return [(re.sub(r'\W+', '_', col.lower().strip())) for col in columns]
 
 def config_select():
     try:
         df = st.session_state['df']
         cols = df.columns
-        pro_cols = [(re.sub(r'\W+', '_', col.lower().strip())) for col in df.columns]
+        pro_cols = processed_columns(df.columns)
+        inferred_types = st.session_state.get('inferred_types', {})
+        if 'sample_info' in st.session_state:
+            st.caption(st.session_state['sample_info'])
 
         # Initialize session state for inputs
         if 'table_name' not in st.session_state:
@@ -287,14 +1500,19 @@ def config_select():
         # Iterate through columns to infer default data type
         column_data_types = {}
         for idx, col in enumerate(cols):
-            default_type = infer_default_type(df[col].dtype)
+            default_type = inferred_types.get(col) or infer_default_type(df[col].tolist())
             options = ['Decimal point Number', 'Number', 'Categorical/String', 'True/False', 'DATE']
             default_value = options.index(default_type) if default_type in options else 2  # Default to 'Categorical/String' if not found
             data_type = st.selectbox(f"Select data type for column '{col}'", options, index=default_value, key=f"col_{idx}")
             column_data_types[col] = f"{pro_cols[cols.get_loc(col)]} {dtype_dict_map[data_type]}"
         st.session_state['column_data_types'] = column_data_types
 
-        # Select the primary keys
+        # Select the primary keys, suggesting the first candidate that is unique in the sample
+        pk_candidates = st.session_state.get('pk_candidates', [])
+        if pk_candidates:
+            st.caption("Primary key candidates (unique in the sample): " + "; ".join(", ".join(candidate) for candidate in pk_candidates))
+            if not st.session_state['primary_keys']:
+                st.session_state['primary_keys'] = pk_candidates[0]
         primary_keys = st.multiselect("Select Primary keys", pro_cols, default=st.session_state['primary_keys'], key="primary_keys_multiselect")
         st.session_state['primary_keys'] = primary_keys
 
@@ -393,8 +1611,40 @@ def config_select():
 def insert_file_tab(config_json_path):
     st.subheader('Create database instance/update existing database instance')
     file = st.file_uploader("Upload Excel file for insertion", type=['xlsx'])
+    if 'ingest_jobs' not in st.session_state:
+        st.session_state['ingest_jobs'] = []
     if file and config_json_path is not None and st.button('Insert'):
-        insert_xls_to_database(file,config_json_path)
+        # The load runs in the background, so reruns of this page do not interrupt it
+        job = job_registry().submit(file.name, file.getvalue(), config_json_path)
+        st.session_state['ingest_jobs'] = (st.session_state['ingest_jobs'] + [job.id])[-5:]
+    jobs = [job for job in map(job_registry().get, st.session_state['ingest_jobs']) if job is not None]
+    if any(job.active() for job in jobs):
+        poll_ingest_jobs(tuple(job.id for job in jobs))
+    else:
+        for job in reversed(jobs):
+            show_ingest_job(job)
+
+@st.fragment(run_every=1)
+def poll_ingest_jobs(job_ids):
+    jobs = [job for job in map(job_registry().get, job_ids) if job is not None]
+    for job in reversed(jobs):
+        show_ingest_job(job)
+    if not any(job.active() for job in jobs):
+        # Render the final results once with the whole page, which also stops the polling
+        st.rerun()
+
+def show_ingest_job(job):
+    st.write(f"**{job.file_name}**: {job.status}")
+    if job.active():
+        st.progress(job.fraction(), text=job.progress_text())
+        if st.button("Cancel", key=f"cancel_{job.id}"):
+            job.cancel()
+    elif job.counts:
+        st.write(f"{format_counts(job.counts)}, {job.counts['failed']} failed")
+    for message in job.messages:
+        st.write(message)
+    if job.run is not None and not job.active():
+        render_metrics(job.run)
 
 def filter_view_data(config_json_path):
     st.subheader('Filter and view Data')
@@ -403,22 +1653,67 @@ def filter_view_data(config_json_path):
     table_name = st.selectbox('Select Table Name', tables)
     if table_name == "none":
         st.warning("Please select a table")
+        connection.close()
     else:
-        df = pd.read_sql(f"SELECT * FROM {table_name}", con=connection)
-        table_view(connection,df,config_json_path,table_name)
-    
-def table_view(connection,df,config_json_path,table_name):
+        with instrumented_run("filter_view", load_plan(config_json_path).db_config) as run:
+            ensure_filter_indexes(config_json_path, table_name)
+            table_view(connection,config_json_path,table_name)
+        render_metrics(run)
+
+def build_where_clause(cat_cols, cat_response, num_cols, num_response):
+    clauses = []
+    params = []
+    for col, value in zip(cat_cols, cat_response):
+        if value != 'All':
+            clauses.append(f"{col} = ?")
+            params.append(value)
+    for col, (min_val, max_val) in zip(num_cols, num_response):
+        clauses.append(f"{col} BETWEEN ? AND ?")
+        params.extend([min_val, max_val])
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+    return where, params
+
+def page_query(table_name, columns, primary_keys, where=""):
+    # Pages are taken in primary key order, without an ORDER BY SQLite may return rows in a different order per query
+    return f"SELECT {', '.join(columns)} FROM {table_name}{where} ORDER BY {', '.join(primary_keys)} LIMIT ? OFFSET ?"
+
+def column_catalog(connection, table_name, config_json_path):
+    # Per-column statistics maintained by the ingest, replacing full-table scans for the filter widgets
+    stats_cols = table_plan(config_json_path, table_name).stats_columns
+    query = "SELECT column_name, min_value, max_value, null_count, capped FROM _column_stats WHERE table_name = ?"
+    stats_df = cached_query(connection, table_name, query, [table_name]) if table_exists("_column_stats", connection) else None
+    if stats_df is None or set(stats_cols) - set(stats_df['column_name'].tolist()):
+        ensure_column_stats(config_json_path, table_name)
+        if not table_exists("_column_stats", connection):
+            return {}, {}
+        stats_df = cached_query(connection, table_name, query, [table_name])
+    stats = {row['column_name']: row for row in stats_df.astype(object).where(stats_df.notna(), None).to_dict('records')}
+    values_df = cached_query(connection, table_name, "SELECT column_name, value FROM _column_values "
+                                                     "WHERE table_name = ? ORDER BY column_name, value", [table_name])
+    values = {}
+    for col, value in zip(values_df['column_name'].tolist(), values_df['value'].tolist()):
+        values.setdefault(col, []).append(value)
+    return stats, values
+
+def table_view(connection,config_json_path,table_name):
     try:
-        with open(config_json_path) as f:
-            config = json.load(f)
-        cat_cols = config['view_mapping'][table_name]["filters"]["categorical"].split(",")
-        num_cols = config['view_mapping'][table_name]["filters"]["numerical"].split(",")
-        
+        plan = load_plan(config_json_path)
+        cat_cols = plan.tables[table_name].categorical_filters
+        num_cols = plan.tables[table_name].numerical_filters
+        primary_keys = plan.tables[table_name].primary_keys
+        page_size = int(plan.db_config.get("page_size", 100))
+        with stage("view_catalog"):
+            stats, values = column_catalog(connection, table_name, config_json_path)
+
         #Handling the categorical columns
         cat_col_val_list = []
         for i in cat_cols:
-            cat_col_val_list.append(['All'] + sorted(list(df[i].unique())))
-        #print(cat_col_val_list)
+            if i in stats and not stats[i]['capped']:
+                cat_col_val_list.append(['All'] + values.get(i, []))
+            else:
+                # High-cardinality column, the catalog only keeps its range
+                distinct = cached_query(connection, table_name, f"SELECT DISTINCT {i} FROM {table_name} WHERE {i} IS NOT NULL ORDER BY {i}")
+                cat_col_val_list.append(['All'] + distinct.iloc[:, 0].tolist())
         cat_response = []
         for i in range(len(cat_col_val_list)):
             cat_response.append(st.selectbox(cat_cols[i],cat_col_val_list[i]))
@@ -426,8 +1721,10 @@ def table_view(connection,df,config_json_path,table_name):
         #Handling the numerical columns
         num_min_max = []
         for i in num_cols:
-            num_min_max.append([(df[i].min()),(df[i].max())])
-        #print(num_min_max)
+            if i in stats:
+                num_min_max.append([stats[i]['min_value'], stats[i]['max_value']])
+            else:
+                num_min_max.append(cached_query(connection, table_name, f"SELECT MIN({i}), MAX({i}) FROM {table_name}").pipe(first_row))
         num_response = []
         for i in range(len(num_min_max)):
             col1, col2 = st.columns([1, 1])
@@ -437,19 +1734,45 @@ def table_view(connection,df,config_json_path,table_name):
                 max_val = st.number_input(f'Maximum:    {num_cols[i]}', value=num_min_max[i][1])
             num_response.append([min_val,max_val])
 
+        # Keep the result visible while paging, the button only stays True for one rerun
+        show_key = f"show_{table_name}"
         if st.button('Show'):
-            filtered_df = df.copy()
-            #Handling categorical filter
-            for i in range(len(cat_response)):
-                if cat_response[i] != 'All':
-                    filtered_df = filtered_df[filtered_df[cat_cols[i]] == cat_response[i]]
-            #Handling numerical filter
-            for i in range(len(num_response)):
-                filtered_df = filtered_df[(filtered_df[num_cols[i]] >= num_response[i][0]) & (filtered_df[num_cols[i]] <= num_response[i][1])]
+            st.session_state[show_key] = True
+        if st.session_state.get(show_key):
+            where, params = build_where_clause(cat_cols, cat_response, num_cols, num_response)
+            with stage("view_count"):
+                total = int(cached_query(connection, table_name, f"SELECT COUNT(*) FROM {table_name}{where}", params).iloc[0, 0])
+            pages = max(1, -(-total // page_size))
+            page = st.number_input(f'Page (of {pages})', min_value=1, max_value=pages, value=1, step=1)
+            with stage("view_page") as record:
+                filtered_df = cached_query(connection, table_name, page_query(table_name, plan.tables[table_name].columns, primary_keys, where),
+                                           params + [page_size, (page - 1) * page_size])
+                record["rows"] = len(filtered_df)
+                record["bytes"] = int(filtered_df.memory_usage(deep=True).sum())
             print("Table view created Successfully")
-            st.write(f"\n{filtered_df.shape[0]} rows found\n")
+            st.write(f"\n{total} rows found\n")
             st.write(filtered_df)
 
+            # Exports stream every matching row to a file; only the page above is sent to the browser
+            export_key = f"export_{table_name}"
+            fmt = st.selectbox("Export format", export_formats(), key=f"export_format_{table_name}")
+            if st.button(f"Export all {total} rows"):
+                # Export names are unique, so this only ever removes this session's own earlier file
+                previous = st.session_state.pop(export_key, None)
+                if previous and os.path.exists(previous[0]):
+                    os.remove(previous[0])
+                path, written = export_view(connection, table_name, list(plan.tables[table_name].columns),
+                                            plan.tables[table_name].column_types, where, params, fmt,
+                                            plan.db_config.get("export_dir", "temp"), primary_keys,
+                                            float(plan.db_config.get("export_max_age_hours", 24)))
+                print(f"Exported {written} rows to {path}")
+                st.session_state[export_key] = (path, fmt, written)
+            if export_key in st.session_state and os.path.exists(st.session_state[export_key][0]):
+                path, fmt, written = st.session_state[export_key]
+                # The file is read only when the download is requested
+                st.download_button(f"Download {os.path.basename(path)} ({written} rows)", data=functools.partial(read_file_bytes, path),
+                                   file_name=os.path.basename(path), mime=EXPORT_FORMATS[fmt][1])
+
     except Exception as e:
         print(e)
         st.write(e)
@@ -458,6 +1781,103 @@ def table_view(connection,df,config_json_path,table_name):
             connection.close()
             print("Connection ended")
     
+EXPORT_FORMATS = {"CSV": (".csv", "text/csv"),
+                  "Excel": (".xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+                  "Parquet": (".parquet", "application/vnd.apache.parquet")}
+# Data rows per worksheet, leaving room for the header within Excel's 1,048,576 row limit
+EXCEL_SHEET_ROWS = 1048575
+
+def export_formats():
+    return [fmt for fmt in EXPORT_FORMATS if fmt != "Parquet" or pq is not None]
+
+def parquet_schema(columns, types):
+    fields = []
+    for col in columns:
+        sql_type = types.get(col, "")
+        if 'BOOL' in sql_type:
+            fields.append(pa.field(col, pa.bool_()))
+        elif 'INT' in sql_type:
+            fields.append(pa.field(col, pa.int64()))
+        elif any(t in sql_type for t in NUMERIC_SQL_TYPES):
+            fields.append(pa.field(col, pa.float64()))
+        else:
+            fields.append(pa.field(col, pa.string()))
+    return pa.schema(fields)
+
+def parquet_batch(rows, schema):
+    # Convert each column to its declared type, since SQLite columns can hold mixed storage classes
+    arrays = []
+    for i, field in enumerate(schema):
+        values = [row[i] for row in rows]
+        if field.type == pa.bool_():
+            values = [None if value is None else bool(value) for value in values]
+        elif field.type == pa.string():
+            values = [None if value is None else str(value) for value in values]
+        arrays.append(pa.array(values, type=field.type))
+    return pa.record_batch(arrays, schema=schema)
+
+def export_query(connection, query, params, columns, types, path, fmt, chunk_size=10000):
+    # Streams the query result to path chunk by chunk, so memory stays flat however many rows match
+    cursor = connection.execute(query, params)
+    written = 0
+    try:
+        if fmt == "CSV":
+            with open(path, "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(columns)
+                while rows := cursor.fetchmany(chunk_size):
+                    writer.writerows(rows)
+                    written += len(rows)
+        elif fmt == "Excel":
+            # Write-only workbooks spool rows to disk instead of keeping cells in memory
+            wb = openpyxl.Workbook(write_only=True)
+            ws = None
+            while rows := cursor.fetchmany(chunk_size):
+                for row in rows:
+                    if written % EXCEL_SHEET_ROWS == 0:
+                        ws = wb.create_sheet(f"data_{written // EXCEL_SHEET_ROWS + 1}")
+                        ws.append(columns)
+                    ws.append(row)
+                    written += 1
+            if ws is None:
+                wb.create_sheet("data_1").append(columns)
+            wb.save(path)
+        elif fmt == "Parquet":
+            schema = parquet_schema(columns, types)
+            with pq.ParquetWriter(path, schema) as writer:
+                while rows := cursor.fetchmany(chunk_size):
+                    writer.write_batch(parquet_batch(rows, schema))
+                    written += len(rows)
+        else:
+            raise ValueError(f"Unknown export format {fmt}")
+    finally:
+        cursor.close()
+    return written
+
+def prune_exports(export_dir, max_age_hours):
+    # Exports left behind by closed sessions are removed once they are older than max_age_hours
+    cutoff = time.time() - max_age_hours * 3600
+    suffixes = tuple(suffix for suffix, _ in EXPORT_FORMATS.values())
+    for entry in os.scandir(export_dir):
+        if entry.is_file() and entry.name.startswith("export_") and entry.name.endswith(suffixes):
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+def export_view(connection, table_name, columns, types, where, params, fmt, export_dir="temp", order_by=(), max_age_hours=24):
+    os.makedirs(export_dir, exist_ok=True)
+    prune_exports(export_dir, max_age_hours)
+    # A random part keeps names unique across sessions exporting the same table at the same time
+    path = os.path.join(export_dir, f"export_{table_name}_{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}{EXPORT_FORMATS[fmt][0]}")
+    order = f" ORDER BY {', '.join(order_by)}" if order_by else ""
+    with stage("export") as record:
+        record["rows"] = export_query(connection, f"SELECT {', '.join(columns)} FROM {table_name}{where}{order}", params,
+                                      columns, types, path, fmt)
+        record["bytes"] = os.path.getsize(path)
+    return path, record["rows"]
+
 def display_graphs_tab(config_json_path):
     st.subheader('View graphs and visuals')
     connection,table_list,_=connect_to_db(config_json_path)
@@ -466,24 +1886,172 @@ def display_graphs_tab(config_json_path):
     if table_name == "none":
         st.warning("Please select a table")
     else:
-        df = pd.read_sql(f"SELECT * FROM {table_name}", con=connection)
-        display_graphs(df,config_json_path,table_name)
+        with instrumented_run("graphs", load_plan(config_json_path).db_config) as run:
+            display_graphs(connection,config_json_path,table_name)
+        render_metrics(run)
+    connection.close()
+
+def chart_axis(col, sql_type):
+    # Numeric SQL expression that orders and spaces a column on a chart axis, or None for text
+    if 'DATE' in sql_type or 'TIME' in sql_type:
+        return f"julianday({col})"
+    if any(t in sql_type for t in NUMERIC_SQL_TYPES):
+        return col
+    return None
+
+def julian_to_datetime(values):
+    return pd.to_datetime(values - 2440587.5, unit='D')
+
+def histogram_counts(connection, table_name, col, sql_type, bins=50):
+    # Bin in SQLite so only one row per bin is returned; dates are binned on julianday,
+    # text columns get their bins most frequent values plus "Other"
+    axis = chart_axis(col, sql_type)
+    if axis is None:
+        return pie_counts(connection, table_name, col, bins), None
+    lo, hi = cached_query(connection, table_name, f"SELECT MIN({axis}), MAX({axis}) FROM {table_name}").pipe(first_row)
+    if lo is None:
+        return pd.DataFrame(columns=['value', 'count']), None
+    if 'INT' in sql_type and hi - lo + 1 <= bins:
+        width = 1
+        start = lo - 0.5
+    else:
+        width = (hi - lo) / bins if hi > lo else 1
+        start = lo
+    df = cached_query(connection, table_name, f"SELECT MIN(CAST(({axis} - ?) / ? AS INTEGER), ?) AS bin, COUNT(*) AS count "
+                                              f"FROM {table_name} WHERE {axis} IS NOT NULL GROUP BY bin ORDER BY bin",
+                      [start, width, bins - 1])
+    centers = start + (df['bin'].astype('int64') + 0.5) * width
+    if axis != col:
+        # Plotly sizes date bars in milliseconds
+        return pd.DataFrame({'value': julian_to_datetime(centers), 'count': df['count']}), width * 86400000
+    return pd.DataFrame({'value': centers, 'count': df['count']}), width
+
+def pie_counts(connection, table_name, col, top_n=10):
+    df = cached_query(connection, table_name, f"SELECT {col} AS value, COUNT(*) AS count FROM {table_name} WHERE {col} IS NOT NULL "
+                                              f"GROUP BY {col} ORDER BY count DESC LIMIT ?", [top_n])
+    total = int(cached_query(connection, table_name, f"SELECT COUNT({col}) FROM {table_name}").iloc[0, 0])
+    other = total - int(df['count'].sum())
+    if other > 0:
+        df = pd.concat([df, pd.DataFrame({'value': ['Other'], 'count': [other]})], ignore_index=True)
+    return df
+
+def line_points(connection, table_name, x, y, types, max_points=5000):
+    # At most max_points (x, y) pairs: the raw series when it is small enough, otherwise the lowest
+    # and highest point of each x bucket, so spikes survive the reduction
+    axis = chart_axis(x, types.get(x, ""))
+    where = f"WHERE {x} IS NOT NULL AND {y} IS NOT NULL"
+    if axis is None:
+        return cached_query(connection, table_name, f"SELECT {x} AS x, AVG({y}) AS y FROM {table_name} {where} "
+                                                    f"GROUP BY {x} ORDER BY {x} LIMIT ?", [max_points])
+    total = int(cached_query(connection, table_name, f"SELECT COUNT(*) FROM {table_name} {where}").iloc[0, 0])
+    if total <= max_points:
+        return cached_query(connection, table_name, f"SELECT {x} AS x, {y} AS y FROM {table_name} {where} ORDER BY {axis}")
+    lo, hi = cached_query(connection, table_name, f"SELECT MIN({axis}), MAX({axis}) FROM {table_name} {where}").pipe(first_row)
+    buckets = max(1, max_points // 2)
+    width = (hi - lo) / buckets if hi > lo else 1
+    bucket = f"MIN(CAST(({axis} - ?) / ? AS INTEGER), ?)"
+    # With a single MIN() or MAX() aggregate, SQLite takes the bare columns from the row holding that extreme
+    parts = [cached_query(connection, table_name, f"SELECT {bucket} AS bucket, {axis} AS pos, {x} AS x, {agg}({y}) AS y "
+                                                  f"FROM {table_name} {where} GROUP BY bucket", [lo, width, buckets - 1])
+             for agg in ("MIN", "MAX")]
+    points = pd.concat(parts, ignore_index=True).drop_duplicates(['bucket', 'pos', 'y']).sort_values('pos')
+    return points[['x', 'y']].reset_index(drop=True)
 
-def display_graphs(df,config_json_path,table_name):
+def scatter_points(connection, table_name, x, y, types, max_points=5000, mode="density"):
+    # At most max_points points: the raw rows when few enough, otherwise a uniform random sample
+    # (mode "sample") or one point per occupied cell of a grid, placed at the cell mean and weighted by its count
+    where = f"WHERE {x} IS NOT NULL AND {y} IS NOT NULL"
+    total = int(cached_query(connection, table_name, f"SELECT COUNT(*) FROM {table_name} {where}").iloc[0, 0])
+    x_axis, y_axis = chart_axis(x, types.get(x, "")), chart_axis(y, types.get(y, ""))
+    if total <= max_points:
+        points = cached_query(connection, table_name, f"SELECT {x} AS x, {y} AS y FROM {table_name} {where}")
+        return points.assign(count=1)
+    if mode == "sample" or x_axis is None or y_axis is None:
+        # One pass with a per-row coin flip instead of sorting the whole table by random()
+        points = cached_query(connection, table_name, f"SELECT {x} AS x, {y} AS y FROM {table_name} {where} "
+                                                      f"AND abs(random() % ?) < ? LIMIT ?", [total, max_points, max_points])
+        return points.assign(count=1)
+    side = max(1, int(max_points ** 0.5))
+    x_lo, x_hi, y_lo, y_hi = cached_query(connection, table_name, f"SELECT MIN({x_axis}), MAX({x_axis}), MIN({y_axis}), MAX({y_axis}) "
+                                                                  f"FROM {table_name} {where}").pipe(first_row)
+    x_width = (x_hi - x_lo) / side if x_hi > x_lo else 1
+    y_width = (y_hi - y_lo) / side if y_hi > y_lo else 1
+    points = cached_query(connection, table_name, f"SELECT MIN(CAST(({x_axis} - ?) / ? AS INTEGER), ?) AS bx, "
+                                                  f"MIN(CAST(({y_axis} - ?) / ? AS INTEGER), ?) AS by, "
+                                                  f"AVG({x_axis}) AS x, AVG({y_axis}) AS y, COUNT(*) AS count "
+                                                  f"FROM {table_name} {where} GROUP BY bx, by",
+                          [x_lo, x_width, side - 1, y_lo, y_width, side - 1])
+    points = points[['x', 'y', 'count']].copy()
+    if x_axis != x:
+        points['x'] = julian_to_datetime(points['x'])
+    if y_axis != y:
+        points['y'] = julian_to_datetime(points['y'])
+    return points
+
+def as_chart_dates(df, col, sql_type):
+    if 'DATE' in sql_type or 'TIME' in sql_type:
+        df[col] = pd.to_datetime(df[col], errors='coerce')
+    return df
+
+def display_graphs(connection,config_json_path,table_name):
     try:
-        with open(config_json_path) as f:
-            config = json.load(f)
-        hist_cols = config['view_mapping'][table_name]["graphs"]["histogram"].split(",")
-        pie_cols = config['view_mapping'][table_name]["graphs"]["pie"].split(",")
+        plan = load_plan(config_json_path)
+        hist_cols = plan.tables[table_name].histogram_columns
+        pie_cols = plan.tables[table_name].pie_columns
+        # rowid is the x axis of a single-column line or scatter chart
+        types = {**plan.tables[table_name].column_types, "rowid": "INTEGER"}
+        line_cols = plan.tables[table_name].line_columns
+        scatter_cols = plan.tables[table_name].scatter_columns
+        bins = int(plan.db_config.get("histogram_bins", 50))
+        top_n = int(plan.db_config.get("pie_top_n", 10))
+        max_points = int(plan.db_config.get("chart_max_points", 5000))
+        scatter_mode = plan.db_config.get("scatter_mode", "density")
+        render_mode = "auto"
+        if line_cols or scatter_cols:
+            webgl = st.checkbox("Render line and scatter charts with WebGL", value=bool(plan.db_config.get("webgl", False)))
+            render_mode = "webgl" if webgl else "svg"
         for i in hist_cols:
             st.subheader(f"Histogram of {i}")
-            fig = px.histogram(df, x=i)
+            with stage("graph_histogram") as record:
+                hist_df, width = histogram_counts(connection, table_name, i, types.get(i, ""), bins)
+                record["rows"] = len(hist_df)
+            fig = px.bar(hist_df, x='value', y='count', labels={'value': i})
+            if width is not None:
+                fig.update_traces(width=width)
+            fig.update_layout(bargap=0)
             st.plotly_chart(fig)
         for i in pie_cols:
-            freq = df[i].value_counts()
-            freq_df = pd.DataFrame({i: freq.index, 'count': freq.values})
+            with stage("graph_pie") as record:
+                freq_df = pie_counts(connection, table_name, i, top_n).rename(columns={'value': i})
+                record["rows"] = len(freq_df)
             fig = px.pie(freq_df, values='count', names=i, title=f'Pie Chart of {i} Frequencies')
             st.plotly_chart(fig)
+        # The first line/scatter column is the x axis and every other column is plotted against it;
+        # a single column is plotted against the row order
+        if line_cols:
+            x, ys = (line_cols[0], line_cols[1:]) if len(line_cols) > 1 else ("rowid", line_cols)
+            st.subheader(f"Line chart of {', '.join(ys)} by {x}")
+            with stage("graph_line") as record:
+                series = [line_points(connection, table_name, x, y, types, max(2, max_points // len(ys))).assign(series=y) for y in ys]
+                line_df = as_chart_dates(pd.concat(series, ignore_index=True), 'x', types.get(x, ""))
+                record["rows"] = len(line_df)
+            fig = px.line(line_df, x='x', y='y', color='series', labels={'x': x, 'y': 'value'}, render_mode=render_mode)
+            st.plotly_chart(fig)
+        if scatter_cols:
+            x, ys = (scatter_cols[0], scatter_cols[1:]) if len(scatter_cols) > 1 else ("rowid", scatter_cols)
+            for y in ys:
+                st.subheader(f"Scatter plot of {y} against {x}")
+                with stage("graph_scatter") as record:
+                    points = scatter_points(connection, table_name, x, y, types, max_points, scatter_mode)
+                    as_chart_dates(points, 'x', types.get(x, ""))
+                    as_chart_dates(points, 'y', types.get(y, ""))
+                    record["rows"] = len(points)
+                reduced = points['count'].max() > 1 if len(points) else False
+                fig = px.scatter(points, x='x', y='y', color='count' if reduced else None, labels={'x': x, 'y': y},
+                                 render_mode=render_mode)
+                st.plotly_chart(fig)
+                if reduced:
+                    st.caption(f"{len(points):,} density cells, coloured by the number of rows in each")
 
 
     except Exception as e:
@@ -0,0 +1,227 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import resource
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+import multiprocessing
+
+import openpyxl
+import pandas as pd
+
+import app
+
+TABLE = "bench"
+REGIONS = ["North", "South", "East", "West", "Central"]
+PRODUCTS = [f"Product {i}" for i in range(40)]
+SEGMENTS = ["Government", "Midmarket", "Enterprise", "Small Business", "Channel Partners"]
+
+HEADER_MAPPING = {
+    "Order ID": "order_id INTEGER",
+    "Region": "region VARCHAR(100)",
+    "Product": "product VARCHAR(100)",
+    "Segment": "segment VARCHAR(100)",
+    "Units Sold": "units_sold INTEGER",
+    "Unit Price": "unit_price REAL",
+    "Discount": "discount REAL",
+    "Order Date": "order_date DATE",
+    "Shipped": "shipped BOOLEAN",
+    "Note": "note VARCHAR(100)",
+    "PRIMARY KEY": "order_id,region",
+}
+
+def generate_workbook(path, rows, seed=0, duplicate_fraction=0.02):
+    # Mixed dtypes, some missing values and a share of repeated primary keys
+    rng = random.Random(seed)
+    start = date(2020, 1, 1)
+    duplicates = int(rows * duplicate_fraction)
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet("data")
+    ws.append([key for key in HEADER_MAPPING if key != "PRIMARY KEY"])
+    for i in range(rows):
+        order_id = rng.randrange(rows - duplicates) if i >= rows - duplicates else i
+        ws.append([
+            order_id,
+            REGIONS[order_id % len(REGIONS)],
+            rng.choice(PRODUCTS),
+            rng.choice(SEGMENTS),
+            rng.randint(1, 5000),
+            round(rng.uniform(1, 500), 2),
+            None if rng.random() < 0.1 else round(rng.uniform(0, 0.3), 3),
+            start + timedelta(days=rng.randrange(1500)),
+            rng.random() < 0.5,
+            None if rng.random() < 0.3 else f"note {rng.randrange(1000)}",
+        ])
+    wb.save(path)
+
+def write_config(path, db_path, batch_size, streaming):
+    config = {
+        "header_mapping": {TABLE: HEADER_MAPPING},
+        "view_mapping": {
+            TABLE: {
+                "graphs": {"histogram": "unit_price,units_sold", "bar": "", "pie": "region,product", "line": "", "scatter": ""},
+                "filters": {"categorical": "region,segment", "numerical": "units_sold,unit_price", "date": "order_date"},
+            }
+        },
+        "db_config": {"db_path": db_path, "table_name": TABLE, "batch_size": batch_size, "streaming": streaming},
+    }
+    with open(path, "w") as f:
+        json.dump(config, f, indent=4)
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+def db_size_mb(db_path):
+    return sum(os.path.getsize(p) for p in (db_path, db_path + "-wal") if os.path.exists(p)) / 2**20
+
+class Recorder:
+    def __init__(self, verbose):
+        self.verbose = verbose
+        self.stages = {}
+
+    @contextlib.contextmanager
+    def stage(self, name, rows):
+        out = contextlib.nullcontext() if self.verbose else contextlib.redirect_stdout(io.StringIO())
+        peak_before = peak_rss_mb()
+        start = time.perf_counter()
+        with out, app.instrumented_run(name) as run:
+            yield
+        elapsed = time.perf_counter() - start
+        peak_after = peak_rss_mb()
+        # ru_maxrss is a high-water mark, so a stage only shows growth when it needs more memory than any stage before it
+        self.stages[name] = {
+            "seconds": round(elapsed, 4),
+            "rows": rows,
+            "rows_per_second": round(rows / elapsed) if elapsed > 0 else None,
+            "peak_rss_mb": round(peak_after, 1),
+            "peak_rss_growth_mb": round(peak_after - peak_before, 1),
+            # Per-stage timings recorded by the application's own instrumentation
+            "breakdown": run.summary(),
+        }
+        print(f"  {name:<24} {elapsed:9.3f}s  {self.stages[name]['rows_per_second'] or 0:>12,} rows/s")
+
+def run_size(rows, workdir, batch_size, seed, verbose):
+    # Runs in its own process so peak RSS is measured per size
+    app.headless_mode()
+    if not verbose:
+        app.logger.setLevel("WARNING")
+    workbook = os.path.join(workdir, f"bench_{rows}_{seed}.xlsx")
+    if not os.path.exists(workbook):
+        print(f"Generating {workbook}")
+        generate_workbook(workbook, rows, seed)
+    db_path = os.path.join(workdir, f"bench_{rows}.db")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    config_path = os.path.join(workdir, f"bench_{rows}.json")
+    write_config(config_path, db_path, batch_size, streaming=False)
+    rec = Recorder(verbose)
+    print(f"{rows:,} rows")
+
+    # Stream first, once create_dataframe holds the whole sheet the high-water mark hides the reader's memory use
+    with rec.stage("iter_dataframe_chunks", rows):
+        streamed = sum(len(chunk) for chunk in app.iter_dataframe_chunks(workbook, -1, TABLE, config_path, 50000))
+    with rec.stage("create_dataframe", rows):
+        df = app.create_dataframe(workbook, -1, TABLE, config_path)
+
+    connection, _, _ = app.connect_to_db(config_path, write=True)
+    try:
+        with rec.stage("table_exists_create_table", 1):
+            if not app.table_exists(TABLE, connection):
+                app.create_table(connection, TABLE, config_path)
+        with rec.stage("upsert_batch_initial", rows):
+            first = app.upsert_batch(TABLE, df, connection, config_path, batch_size, report=False)
+        with rec.stage("upsert_batch_unchanged", rows):
+            second = app.upsert_batch(TABLE, df, connection, config_path, batch_size, report=False)
+        with rec.stage("finish_tables", rows):
+            app.finish_tables(connection, [TABLE], config_path)
+    finally:
+        connection.close()
+
+    # A plain connection bypasses the snapshot cache so every query really runs
+    reader = sqlite3.connect(db_path)
+    plan = app.table_plan(config_path, TABLE)
+    with rec.stage("table_view_filter", rows):
+        stats, values = app.column_catalog(reader, TABLE, config_path)
+        where, params = app.build_where_clause(
+            plan.categorical_filters, [values["region"][0], "All"],
+            plan.numerical_filters, [[stats[col]["min_value"], stats[col]["max_value"]] for col in plan.numerical_filters])
+        found = reader.execute(f"SELECT COUNT(*) FROM {TABLE}{where}", params).fetchone()[0]
+        pd.read_sql(app.page_query(TABLE, plan.columns, plan.primary_keys, where), reader, params=params + [100, 0])
+    with rec.stage("display_graphs_prep", rows):
+        for col in plan.histogram_columns:
+            app.histogram_counts(reader, TABLE, col, plan.column_types[col])
+        for col in plan.pie_columns:
+            app.pie_counts(reader, TABLE, col)
+    reader.close()
+
+    return {
+        "rows": rows,
+        "streamed_rows": streamed,
+        "filtered_rows": found,
+        "initial_upsert": dict(first),
+        "repeat_upsert": dict(second),
+        "stages": rec.stages,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "sqlite_file_mb": round(db_size_mb(db_path), 2),
+    }
+
+def compare(results, baseline_path, threshold):
+    with open(baseline_path) as f:
+        baseline = {run["rows"]: run for run in json.load(f)["runs"]}
+    regressions = []
+    for run in results["runs"]:
+        base = baseline.get(run["rows"])
+        if base is None:
+            continue
+        for name, stage in run["stages"].items():
+            before = base["stages"].get(name, {}).get("seconds")
+            if before and stage["seconds"] > before * (1 + threshold):
+                regressions.append(f"{run['rows']:,} rows {name}: {before:.3f}s -> {stage['seconds']:.3f}s")
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    return not regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ingest, filter and chart paths on synthetic workbooks")
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="comma separated row counts")
+    parser.add_argument("--workdir", default="bench_data")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="earlier results file to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown before a stage counts as a regression")
+    parser.add_argument("--verbose", action="store_true", help="show the application's own output")
+    args = parser.parse_args()
+
+    os.makedirs(args.workdir, exist_ok=True)
+    results = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "batch_size": args.batch_size,
+        "runs": [],
+    }
+    context = multiprocessing.get_context("spawn")
+    for rows in [int(size) for size in args.sizes.split(",")]:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            results["runs"].append(executor.submit(run_size, rows, args.workdir, args.batch_size, args.seed, args.verbose).result())
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=4)
+    print(f"Results written to {args.output}")
+    if args.compare and not compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import argparse
+import glob
+import multiprocessing
+import os
+import shutil
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import app
+
+def expand_paths(patterns):
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True)) if glob.has_magic(pattern) else [pattern]
+        if not matches:
+            print(f"Warning: no files match '{pattern}'")
+        paths.extend(os.path.abspath(path) for path in matches if os.path.isfile(path))
+    # Keep the first occurrence so a file listed twice is not loaded twice
+    return list(dict.fromkeys(paths))
+
+def record_file(connection, config_json_path, table_names, path, file_hash, file_counts, totals, finished, archive_dir):
+    for table, counts in file_counts.items():
+        print(f"{path} -> {table}: {app.format_counts(counts)}")
+        totals.update(counts)
+    for table in set(table_names) - set(file_counts):
+        print(f"{path} -> {table}: sheet could not be read")
+    # Every configured sheet must have loaded, or the file is left for a retry
+    if set(file_counts) == set(table_names) and all(map(app.loaded_cleanly, file_counts.values())):
+        for table, counts in file_counts.items():
+            app.record_ingest(connection, file_hash, table, counts, config_json_path)
+        totals['files_loaded'] += 1
+        finished.add(path)
+        if archive_dir:
+            os.makedirs(archive_dir, exist_ok=True)
+            shutil.move(path, os.path.join(archive_dir, os.path.basename(path)))
+    else:
+        totals['files_failed'] += 1
+
+def ingest_paths(config_json_path, paths, workers, archive_dir=None, finished=None):
+    # Workbooks are parsed in a process pool and written by this process alone, in the given order.
+    # Paths that were loaded or are unchanged since their last ingest are added to finished
+    finished = set() if finished is None else finished
+    connection, table_names, batch_size = app.connect_to_db(config_json_path, write=True)
+    creds = app.load_plan(config_json_path).db_config
+    totals = Counter()
+    try:
+        app.ensure_ledger(connection)
+        pending = []
+        for path in paths:
+            file_hash = app.file_fingerprint(path)
+            if app.file_already_ingested(connection, file_hash, table_names, config_json_path):
+                print(f"{path}: unchanged since its last ingest, skipping")
+                totals['files_skipped'] += 1
+                finished.add(path)
+                continue
+            pending.append((path, file_hash))
+        if not pending:
+            return totals
+        for table in table_names:
+            if not app.prepare_table(connection, table, config_json_path):
+                totals['failed'] += 1
+                return totals
+
+        if creds.get("streaming", False):
+            # Large workbooks are streamed in chunks by the app's sheet parsers, one file at a time
+            chunk_size = int(creds.get("chunk_size", 50000))
+            for path, file_hash in pending:
+                with app.instrumented_run(f"ingest {os.path.basename(path)}", creds):
+                    file_counts = app.insert_sheets_parallel(path, table_names, connection, config_json_path,
+                                                             batch_size, True, chunk_size, workers)
+                record_file(connection, config_json_path, table_names, path, file_hash, file_counts, totals, finished, archive_dir)
+        else:
+            parse_workbooks(connection, config_json_path, table_names, batch_size, creds, pending, workers,
+                            totals, finished, archive_dir)
+        app.finish_tables(connection, table_names, config_json_path)
+    finally:
+        connection.close()
+    return totals
+
+def parse_workbooks(connection, config_json_path, table_names, batch_size, creds, pending, workers, totals, finished, archive_dir):
+    # Spawned like the app's sheet parsers, fork is not safe from a threaded process
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        # Only a window of parsed workbooks is in flight, so memory does not grow with the file count
+        window = workers + 1
+        futures = [executor.submit(app.parse_workbook_worker, path, table_names, config_json_path)
+                   for path, _ in pending[:window]]
+        for i, (path, file_hash) in enumerate(pending):
+            if i + window < len(pending):
+                futures.append(executor.submit(app.parse_workbook_worker, pending[i + window][0], table_names, config_json_path))
+            with app.instrumented_run(f"ingest {os.path.basename(path)}", creds) as run:
+                with app.stage("wait_for_parse"):
+                    try:
+                        sheets, parse_stages = futures[i].result()
+                    except Exception as e:
+                        print(f"{path}: could not be parsed: {e}")
+                        totals['files_failed'] += 1
+                        continue
+                for parsed in parse_stages:
+                    run.add(parsed["stage"], parsed["seconds"], parsed["rows"], parsed["bytes"])
+                file_counts = {}
+                for table, df in sheets:
+                    file_counts[table] = app.upsert_batch(table, df, connection, config_json_path, batch_size, report=False)
+                record_file(connection, config_json_path, table_names, path, file_hash, file_counts, totals, finished, archive_dir)
+
+def watch(config_json_path, directory, pattern, interval, workers, archive_dir):
+    # A file is picked up once its size and mtime are the same on two polls, i.e. it has been fully written
+    seen = {}
+    done = set()
+    print(f"Watching {directory} for {pattern} every {interval}s, Ctrl+C to stop")
+    try:
+        while True:
+            ready = []
+            for path in sorted(glob.glob(os.path.join(directory, pattern))):
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                signature = (stat.st_size, stat.st_mtime_ns)
+                if (path, signature) in done:
+                    continue
+                if seen.get(path) == signature:
+                    ready.append((path, signature))
+                seen[path] = signature
+            if ready:
+                # A file that failed, or a poll that raised, is not marked done and is retried on the next poll
+                finished = set()
+                try:
+                    totals = ingest_paths(config_json_path, [path for path, _ in ready], workers, archive_dir, finished)
+                    print(summary_line(totals))
+                except Exception as e:
+                    print(f"Error while loading {len(ready)} files, retrying on the next poll: {e}")
+                done.update((path, signature) for path, signature in ready if path in finished)
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print("Stopped watching")
+
+def summary_line(totals):
+    return (f"{totals['files_loaded']} files loaded, {totals['files_skipped']} unchanged, {totals['files_failed']} failed; "
+            f"rows: {app.format_counts(totals)}, {totals['failed']} failed")
+
+def main():
+    parser = argparse.ArgumentParser(description="Load Excel workbooks into the database without the Streamlit UI")
+    parser.add_argument("config", help="config JSON created by the app")
+    parser.add_argument("paths", nargs="*", help="workbook files or glob patterns, e.g. 'exports/*.xlsx'")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="parser processes")
+    parser.add_argument("--watch", metavar="DIR", help="keep running and load workbooks dropped into DIR")
+    parser.add_argument("--pattern", default="*.xlsx", help="file pattern for --watch")
+    parser.add_argument("--interval", type=float, default=5.0, help="seconds between --watch polls")
+    parser.add_argument("--archive", metavar="DIR", help="move successfully loaded files to DIR")
+    args = parser.parse_args()
+    if not args.paths and not args.watch:
+        parser.error("give workbook paths, --watch DIR, or both")
+
+    app.headless_mode()
+    workers = max(1, args.workers)
+    failed = False
+    if args.paths:
+        totals = ingest_paths(args.config, expand_paths(args.paths), workers, args.archive)
+        print(summary_line(totals))
+        failed = bool(totals['files_failed'] or totals['failed'])
+    if args.watch:
+        watch(args.config, args.watch, args.pattern, args.interval, workers, args.archive)
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
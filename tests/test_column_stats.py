@@ -0,0 +1,91 @@
+import json
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import app
+
+
+@pytest.fixture(params=["batch", "staging"])
+def config(tmp_path, request):
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps({
+        "header_mapping": {
+            "codes": {
+                "Id": "id INTEGER",
+                "Code": "code VARCHAR(100)",
+                "Amount": "amount REAL",
+                "PRIMARY KEY": "id",
+            }
+        },
+        "view_mapping": {
+            "codes": {
+                "graphs": {"histogram": "", "bar": "", "pie": "", "line": "", "scatter": ""},
+                "filters": {"categorical": "code", "numerical": "amount", "date": ""},
+            }
+        },
+        "db_config": {"db_path": str(tmp_path / "codes.db"), "table_name": "codes", "batch_size": 2,
+                      "merge_mode": request.param},
+    }))
+    return str(path)
+
+
+def load(config, rows):
+    connection = sqlite3.connect(app.load_plan(config).db_path)
+    try:
+        app.prepare_table(connection, "codes", config)
+        df = pd.DataFrame(rows, columns=["id", "code", "amount"], dtype=object)
+        return app.upsert_batch("codes", df, connection, config, batch_size=2, report=False)
+    finally:
+        connection.close()
+
+
+def assert_catalog_matches_table(config):
+    connection = sqlite3.connect(app.load_plan(config).db_path)
+    try:
+        for col in ("code", "amount"):
+            expected = connection.execute(
+                f"SELECT MIN({col}), MAX({col}), COUNT(*) - COUNT({col}) FROM codes").fetchone()
+            stored = connection.execute(
+                "SELECT min_value, max_value, null_count FROM _column_stats WHERE table_name = 'codes' AND column_name = ?",
+                (col,)).fetchone()
+            # min/max only widen on updates, so they bound the table's values
+            assert stored[2] == expected[2]
+            assert connection.execute("SELECT ? <= ? AND ? >= ?", (stored[0], expected[0], stored[1], expected[1])).fetchone()[0]
+            values = connection.execute(
+                "SELECT value, count FROM _column_values WHERE table_name = 'codes' AND column_name = ? ORDER BY 1",
+                (col,)).fetchall()
+            counts = connection.execute(
+                f"SELECT {col}, COUNT(*) FROM codes WHERE {col} IS NOT NULL GROUP BY {col} ORDER BY {col}").fetchall()
+            assert values == counts
+    finally:
+        connection.close()
+
+
+def test_mixed_text_and_numbers_do_not_fail_the_write(config):
+    counts = load(config, [(1, "A", 1.5), (2, 5, None), (3, "B", 2.0)])
+
+    assert counts["inserted"] == 3
+    assert counts["failed"] == 0
+    assert_catalog_matches_table(config)
+
+
+def test_updates_move_counts_from_old_to_new_values(config):
+    load(config, [(1, "A", 1.5), (2, 5, None), (3, "B", 2.0)])
+    counts = load(config, [(1, "B", 1.5), (2, "A", 3.0), (3, "B", 2.0), (4, None, 0.5)])
+
+    assert (counts["inserted"], counts["updated"], counts["skipped"], counts["failed"]) == (1, 2, 1, 0)
+    assert_catalog_matches_table(config)
+
+
+def test_refreshing_the_statistics_bumps_the_table_version(config):
+    load(config, [(1, "A", 1.5), (2, "B", 2.0)])
+    connection = sqlite3.connect(app.load_plan(config).db_path)
+    try:
+        before = app.table_version(connection, "codes")
+        app.refresh_column_stats(connection, "codes", config)
+
+        assert app.table_version(connection, "codes") > before
+    finally:
+        connection.close()
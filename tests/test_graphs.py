@@ -0,0 +1,64 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import app
+
+
+@pytest.fixture
+def connection():
+    connection = sqlite3.connect(":memory:")
+    connection.execute("CREATE TABLE t (n INTEGER, x REAL, d DATE, s VARCHAR(10))")
+    yield connection
+    connection.close()
+
+
+def fill(connection, col, values):
+    connection.executemany(f"INSERT INTO t ({col}) VALUES (?)", [(value,) for value in values])
+
+
+def test_small_integer_range_gets_one_bin_per_value(connection):
+    fill(connection, "n", [1, 2, 2, 3, 5, 5, 5, None])
+
+    df, width = app.histogram_counts(connection, "t", "n", "INTEGER", bins=10)
+
+    assert width == 1
+    assert list(zip(df["value"], df["count"])) == [(1, 1), (2, 2), (3, 1), (5, 3)]
+
+
+def test_max_value_falls_into_the_last_bin(connection):
+    fill(connection, "x", [0.0, 1.0, 2.0, 3.0, 4.0])
+
+    df, width = app.histogram_counts(connection, "t", "x", "REAL", bins=2)
+
+    assert width == 2
+    assert list(zip(df["value"], df["count"])) == [(1.0, 2), (3.0, 3)]
+
+
+def test_wide_integer_range_is_binned(connection):
+    fill(connection, "n", range(101))
+
+    df, width = app.histogram_counts(connection, "t", "n", "INTEGER", bins=4)
+
+    assert width == 25
+    assert df["count"].tolist() == [25, 25, 25, 26]
+
+
+def test_dates_are_binned_between_their_min_and_max(connection):
+    fill(connection, "d", ["2024-01-01", "2024-01-02", "2024-01-05", "2024-01-09", "not a date"])
+
+    df, width = app.histogram_counts(connection, "t", "d", "DATE", bins=4)
+
+    assert width == 2 * 86400000
+    assert df["value"].tolist() == list(pd.to_datetime(["2024-01-02", "2024-01-06", "2024-01-08"]))
+    assert df["count"].tolist() == [2, 1, 1]
+
+
+def test_text_keeps_the_most_frequent_values_and_groups_the_rest(connection):
+    fill(connection, "s", ["a"] * 5 + ["b"] * 3 + ["c", "d", None])
+
+    df, width = app.histogram_counts(connection, "t", "s", "VARCHAR(10)", bins=2)
+
+    assert width is None
+    assert list(zip(df["value"], df["count"])) == [("a", 5), ("b", 3), ("Other", 2)]
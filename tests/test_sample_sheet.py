@@ -0,0 +1,36 @@
+import openpyxl
+import pytest
+
+import app
+
+
+def write_sheet(path, rows):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(["Id", "Name"])
+    for i in range(rows):
+        ws.append([i, f"name {i}"])
+    wb.save(path)
+    return str(path)
+
+
+@pytest.mark.parametrize("rows, sample_rows", [(10, 4), (1000, 10), (1001, 7), (37, 1), (3, 10)])
+def test_sample_keeps_the_last_row_and_stays_within_sample_rows(tmp_path, rows, sample_rows):
+    path = write_sheet(tmp_path / "sheet.xlsx", rows)
+
+    df, scanned, complete = app.sample_sheet(path, sample_rows=sample_rows)
+
+    assert len(df) == min(rows, sample_rows)
+    assert df["Id"].iloc[-1] == rows - 1
+    assert df["Id"].is_monotonic_increasing and df["Id"].is_unique
+    assert (scanned, complete) == (rows, True)
+
+
+def test_sample_stops_after_scan_rows(tmp_path):
+    path = write_sheet(tmp_path / "sheet.xlsx", 500)
+
+    df, scanned, complete = app.sample_sheet(path, sample_rows=20, scan_rows=100)
+
+    assert len(df) == 20
+    assert df["Id"].iloc[-1] == 99
+    assert (scanned, complete) == (100, False)
@@ -0,0 +1,31 @@
+import random
+import sqlite3
+
+import app
+
+
+def test_where_clause_skips_all_and_binds_every_value():
+    where, params = app.build_where_clause(["region", "segment"], ["North", "All"],
+                                           ["units", "price"], [[1, 10], [0.5, 2.5]])
+
+    assert where == " WHERE region = ? AND units BETWEEN ? AND ? AND price BETWEEN ? AND ?"
+    assert params == ["North", 1, 10, 0.5, 2.5]
+
+
+def test_where_clause_is_empty_without_filters():
+    assert app.build_where_clause([], [], [], []) == ("", [])
+    assert app.build_where_clause(["region"], ["All"], [], []) == ("", [])
+
+
+def test_pages_come_back_in_primary_key_order():
+    connection = sqlite3.connect(":memory:")
+    connection.execute("CREATE TABLE orders (region TEXT, id INTEGER, units INTEGER, PRIMARY KEY (region, id))")
+    rows = [(region, i, i % 7) for region in ("North", "South", "East") for i in range(10)]
+    random.Random(0).shuffle(rows)
+    connection.executemany("INSERT INTO orders VALUES (?, ?, ?)", rows)
+    where, params = app.build_where_clause([], [], ["units"], [[0, 5]])
+    query = app.page_query("orders", ["region", "id", "units"], ["region", "id"], where)
+
+    pages = [connection.execute(query, params + [4, offset]).fetchall() for offset in range(0, 32, 4)]
+
+    assert [row for page in pages for row in page] == sorted(row for row in rows if row[2] <= 5)
@@ -0,0 +1,89 @@
+import json
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import app
+
+
+@pytest.fixture(params=["batch", "staging"])
+def config(tmp_path, request):
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps({
+        "header_mapping": {
+            "items": {
+                "Id": "id INTEGER",
+                "Name": "name VARCHAR(100)",
+                "PRIMARY KEY": "id",
+            }
+        },
+        "db_config": {"db_path": str(tmp_path / "items.db"), "table_name": "items", "batch_size": 2,
+                      "merge_mode": request.param},
+    }))
+    return str(path)
+
+
+@pytest.fixture
+def connection(config):
+    connection = sqlite3.connect(json.load(open(config))["db_config"]["db_path"])
+    app.create_table(connection, "items", config)
+    yield connection
+    connection.close()
+
+
+def stored_rows(connection):
+    return connection.execute("SELECT id, name FROM items ORDER BY id").fetchall()
+
+
+def test_a_failing_batch_rolls_back_only_itself(config, connection):
+    # "x" cannot be stored in an INTEGER PRIMARY KEY, which fails the second batch of two rows
+    df = pd.DataFrame({"id": [1, 2, "x", 4, 5, 6], "name": ["a", "b", "c", "d", "e", "f"]})
+
+    counts = app.upsert_batch("items", df, connection, config, batch_size=2)
+
+    assert (counts["inserted"], counts["failed"]) == (4, 2)
+    assert stored_rows(connection) == [(1, "a"), (2, "b"), (5, "e"), (6, "f")]
+
+
+def test_unchanged_rows_are_counted_as_skipped(config, connection):
+    app.upsert_batch("items", pd.DataFrame({"id": [1, 2, 3], "name": ["a", "b", "c"]}), connection, config)
+
+    counts = app.upsert_batch("items", pd.DataFrame({"id": [1, 2, 3, 4], "name": ["a", "B", "c", "d"]}),
+                              connection, config)
+
+    assert (counts["inserted"], counts["updated"], counts["skipped"]) == (1, 1, 2)
+    assert stored_rows(connection) == [(1, "a"), (2, "B"), (3, "c"), (4, "d")]
+
+
+@pytest.mark.parametrize("batch_size", [2, 10])
+def test_a_repeated_key_keeps_its_last_row(config, connection, batch_size):
+    df = pd.DataFrame({"id": [1, 2, 1, 3, 1], "name": ["a", "b", "c", "d", "e"]})
+
+    counts = app.upsert_batch("items", df, connection, config, batch_size=batch_size)
+
+    assert (counts["inserted"], counts["duplicates"]) == (3, 2)
+    assert stored_rows(connection) == [(1, "e"), (2, "b"), (3, "d")]
+
+
+def test_the_last_row_wins_across_batches(config, connection):
+    app.upsert_batch("items", pd.DataFrame({"id": [1, 2, 3, 4], "name": ["a", "b", "c", "d"]}), connection, config)
+
+    counts = app.upsert_batch("items", pd.DataFrame({"id": [3, 1], "name": ["c", "A"]}), connection, config, batch_size=1)
+    counts += app.upsert_batch("items", pd.DataFrame({"id": [1, 4], "name": ["AA", "d"]}), connection, config, batch_size=1)
+
+    assert (counts["updated"], counts["skipped"]) == (2, 2)
+    assert stored_rows(connection) == [(1, "AA"), (2, "b"), (3, "c"), (4, "d")]
+
+
+def test_an_unchanged_file_is_skipped_through_the_ledger(config, connection, tmp_path, monkeypatch):
+    path = tmp_path / "items.xlsx"
+    pd.DataFrame({"Id": [1, 2], "Name": ["a", "b"]}).to_excel(path, index=False)
+    app.insert_xls_to_database(str(path), config)
+    calls = []
+    monkeypatch.setattr(app, "upsert_batch", lambda *args, **kwargs: calls.append(args))
+
+    app.insert_xls_to_database(str(path), config)
+
+    assert calls == []
+    assert stored_rows(connection) == [(1, "a"), (2, "b")]